@@ -1,15 +1,89 @@
 # client for working with ClueGO API
-import requests
 import json
 import os
 from pathlib import Path
 from urllib.parse import quote
-import py4cytoscape as cy
 import csv
+import time
+import threading
+import requests
+from concurrent.futures import CancelledError, ThreadPoolExecutor
+from transport import Transport
+
+# specificity: (min GO level, max GO level, min genes per term, min % of term genes mapped)
+SPECIFICITY_PRESETS = {
+    "global": (1, 4, 50, 0),
+    "medium": (3, 8, 3, 3),
+    "semi-detailed": (6, 12, 6, 12),
+    "detailed": (7, 15, 1, 50),
+}
+
+# result downloads offered by export_results: format -> (file name, endpoint)
+EXPORT_FORMATS = {
+    "network": ("ClueGO-Network.svg", "networks/{suid}/views/first.svg"),
+    "table": ("ClueGO-Result-Table.txt", "analysis-results/get-cluego-table/{suid}"),
+    "main_functions": (
+        "ClueGO-Genes-With-Main-Functions.txt",
+        "analysis-results/get-main-functions/{suid}/{n}",
+    ),
+    "gene_table": ("ClueGO-Gene-Table.txt", "analysis-results/get-gene-table/{suid}"),
+    "kappa_matrix": (
+        "ClueGO-Kappascore-Matrix.txt",
+        "analysis-results/get-kappascore-matrix/{suid}",
+    ),
+    "gene_term_matrix": (
+        "ClueGO-Binary-Gene-Term-Matrix.txt",
+        "analysis-results/get-binary-gene-term-matrix/{suid}",
+    ),
+    "chart": (
+        "ClueGO-PieChart-For-Cluster{cluster}.svg",
+        "analysis-results/get-cluego-result-chart/{suid}/{cluster}/{type}/{format}",
+    ),
+}
+
+# endpoint each setting is PUT to, as reported to transport instrumentation
+SETTING_ENDPOINTS = {
+    "organism": "organisms/set-organism/{organism}",
+    "ontologies": "ontologies/set-ontologies",
+    "max-input-panel": "cluster/max-input-panel/{n}",
+    "visual-style": "cluster/select-visual-style/{style}",
+    "id-type": "ids/set-id-type/{id_type}",
+    "genes": "cluster/upload-ids-list/{cluster}",
+    "cluster": "cluster/set-analysis-properties/{cluster}/{shape}/{color}/{min_genes}/{min_pct}/{no_restrictions}",
+    "levels": "ontologies/set-min-max-levels/{min}/{max}/{all_levels}",
+    "statistics": "stats/{type}/{correction}/{mid_pvalues}/{doubling}",
+    "kappa": "ontologies/set-kappa-score-level/{kappa}",
+    "grouping": "grouping/{do_grouping}/{coloring}/{leading_term}/{type}/{init_size}/{pct_groups}/{pct_terms}",
+}
+
+
+class ClueGoUnavailableError(requests.ConnectionError):
+    """
+    Cytoscape cannot be reached, or ClueGO is not installed / not started in it.
+    """
 
 
 class ClueGoClient:
-    def __init__(self, name="CLUEGO client unnamed",host_address ="localhost" ):
+    # seconds a successful handshake with a Cytoscape instance stays valid
+    HANDSHAKE_TTL = 300
+    # base url -> time.monotonic() of the last successful handshake, shared by all clients
+    _handshakes = {}
+    _handshake_locks = {}
+    _handshake_lock = threading.Lock()
+
+    def __init__(
+        self,
+        name="CLUEGO client unnamed",
+        host_address="localhost",
+        transport=None,
+        port_number="1234",
+    ):
+        """
+        :param transport (Transport) - shared HTTP transport; a default pooled one is created if None
+        :param port_number (str) - cyREST port of the Cytoscape instance
+
+        Nothing is sent to Cytoscape until the first request, see ensure_online.
+        """
 
         self.EXAMPLE_NAME = name
         self.SEP = "/"
@@ -23,7 +97,7 @@ class ClueGoClient:
         self.CLUEGO_HOME_FOLDER = (
             self.HOME_FOLDER + self.SEP + "ClueGOConfiguration" + self.SEP + "v2.5.10"
         )
-        self.PORT_NUMBER = "1234"
+        self.PORT_NUMBER = str(port_number)
         self.HOST_ADDRESS = host_address
         self.HEADERS = {"Content-Type": "application/json"}
         # define base urls
@@ -40,53 +114,172 @@ class ClueGoClient:
             + "cluego-manager"
         )
 
+        self.transport = transport if transport is not None else Transport()
+
         self.NUM_CLUSTERS = None
         self._ORGANISM = None
+        # last value ClueGO accepted for each setting, see __put_setting
+        self._applied = {}
+        # the shared handshake _applied is valid for, see ensure_online
+        self._handshake_seen = None
+        # ClueGO runs one analysis at a time, see run_analysis_async
+        self._analysis_executor = None
+
+    def ensure_online(self, force=False):
+        """
+        Runs the handshake (cyREST ping, ClueGO and CluePedia installed, ClueGO started) unless a
+        client for the same Cytoscape passed it less than HANDSHAKE_TTL seconds ago.
+        Called before every request; raises ClueGoUnavailableError if the handshake fails.
 
-        self.__verify_cytoscape_connection()
-        self.__verify_CLUEGO_installation()
-        self.__verify_ClUEGO_is_active()
+        Cytoscape may have restarted with fresh state whenever the handshake runs again, so the
+        config cache is cleared each time a new handshake has passed, whichever client ran it.
+        """
+        url = self.CYTOSCAPE_BASE_URL
+        last = ClueGoClient._handshakes.get(url)
+        if not force and last is not None and time.monotonic() - last < self.HANDSHAKE_TTL:
+            self.__sync_handshake(last)
+            return
+
+        with ClueGoClient._handshake_lock:
+            lock = ClueGoClient._handshake_locks.setdefault(url, threading.Lock())
+        with lock:
+            # another client may have finished the handshake while we waited
+            last = ClueGoClient._handshakes.get(url)
+            if not force and last is not None and time.monotonic() - last < self.HANDSHAKE_TTL:
+                self.__sync_handshake(last)
+                return
+            try:
+                self.__verify_cytoscape_connection()
+                self.__verify_CLUEGO_installation()
+                self.__verify_ClUEGO_is_active()
+            except ClueGoUnavailableError:
+                ClueGoClient._handshakes.pop(url, None)
+                self.invalidate_config_cache()
+                raise
+            ClueGoClient._handshakes[url] = time.monotonic()
+            self.__sync_handshake(ClueGoClient._handshakes[url])
         print("client is online.....")
 
+    def __sync_handshake(self, handshake):
+        if handshake != self._handshake_seen:
+            self.invalidate_config_cache()
+            self._handshake_seen = handshake
+
     def __verify_cytoscape_connection(self):
         try:
-            print(self.CYTOSCAPE_BASE_URL)
-            cy.cytoscape_ping(self.CYTOSCAPE_BASE_URL)
-        except Exception as e:
-            exit()
+            response = self.transport.get(
+                self.CYTOSCAPE_BASE_URL + self.SEP + "version", endpoint="version"
+            )
+            response.raise_for_status()
+        except requests.RequestException as e:
+            raise ClueGoUnavailableError(
+                f"Cytoscape is not reachable at {self.CYTOSCAPE_BASE_URL}"
+            ) from e
 
     def __verify_CLUEGO_installation(self):
         try:
-            dependencies = [
-                app
-                for app in cy.get_installed_apps(self.CYTOSCAPE_BASE_URL)
-                if app["appName"] == "ClueGO" or app["appName"] == "CluePedia"
-            ]
-            if len(dependencies) != 2:
-                print(
-                    f"ClueGO and Cluepedia must be installed for use of this client. At least one is not.\ninstalled packages : {dependancies}"
-                )
-        except Exception as e:
-            exit()
+            response = self.transport.post(
+                self.SEP.join([self.CYTOSCAPE_BASE_URL, "commands", "apps", "list installed"]),
+                endpoint="commands/apps/list installed",
+            )
+            response.raise_for_status()
+            installed = [app["appName"] for app in response.json()["data"]]
+        except (requests.RequestException, ValueError, KeyError) as e:
+            raise ClueGoUnavailableError("could not list the installed Cytoscape apps") from e
+
+        if "ClueGO" not in installed or "CluePedia" not in installed:
+            print(
+                f"ClueGO and Cluepedia must be installed for use of this client. At least one is not.\ninstalled packages : {installed}"
+            )
 
     def __verify_ClUEGO_is_active(self):
+        # read-only, so a repeated handshake never changes ClueGO's settings
+        url = self.SEP.join(
+            [self.CLUEGO_BASE_URL, "organisms", "get-all-installed-organisms"]
+        )
         try:
-            url = (
-                self.CLUEGO_BASE_URL
-                + self.SEP
-                + "organisms"
-                + self.SEP
-                + "set-organism"
-                + self.SEP
-                + quote("Homo Sapiens")
+            response = self.transport.get(
+                url, endpoint="organisms/get-all-installed-organisms"
+            )
+        except requests.RequestException as e:
+            raise ClueGoUnavailableError("ClueGO did not answer") from e
+        if not str(response.status_code).startswith("2"):
+            raise ClueGoUnavailableError(
+                "ClueGO/CluePedia needs to be started in Cytoscape"
             )
-            response = requests.put(url)
-            if not str(response.status_code).startswith("2"):
-                print("ClueGO/CluePedia needs to be started in Cytoscape")
-                exit()
 
-        except Exception as e:
-            exit()
+    def __request(self, method, url, **kwargs):
+        """
+        A connection error means Cytoscape went away (and may come back with fresh state), so
+        the shared handshake expires and the config cache is dropped.
+        """
+        self.ensure_online()
+        try:
+            return self.transport.request(method, url, **kwargs)
+        except requests.ConnectionError:
+            ClueGoClient._handshakes.pop(self.CYTOSCAPE_BASE_URL, None)
+            self.invalidate_config_cache()
+            raise
+
+    def __unchanged(self, setting, value, force):
+        """
+        True if ClueGO already holds value for setting, in which case the PUT is skipped
+        """
+        # a due handshake clears the cache first
+        self.ensure_online()
+        if force or setting not in self._applied:
+            return False
+        return self._applied[setting] == value
+
+    def __put_setting(self, setting, value, url, **kwargs):
+        """
+        PUTs a setting and records it as applied only if ClueGO accepted it.
+        """
+        name = setting[0] if isinstance(setting, tuple) else setting
+        response = self.__request("PUT", url, endpoint=SETTING_ENDPOINTS[name], **kwargs)
+        if str(response.status_code).startswith("2"):
+            self._applied[setting] = value
+        else:
+            self._applied.pop(setting, None)
+        return response
+
+    def invalidate_config_cache(self):
+        """
+        Forget every cached setting; call this after restarting Cytoscape or changing settings in the GUI.
+        """
+        self._applied.clear()
+
+    def analysis_inputs(self):
+        """
+        Everything known to have been applied that determines the result of run_analysis,
+        as a JSON-serialisable dict with a canonical ordering (see result_cache.ResultCache).
+        Settings never changed through this client are left at ClueGO's defaults and are absent.
+        """
+        inputs = {}
+        for setting, value in self._applied.items():
+            if isinstance(setting, tuple):
+                setting = " ".join(str(part) for part in setting)
+            inputs[setting] = list(value) if isinstance(value, tuple) else value
+        return dict(sorted(inputs.items()))
+
+    def missing_analysis_inputs(self):
+        """
+        Settings that decide the result of run_analysis but were never applied through this
+        client, so ClueGO may hold anything for them. result_cache.cached_analysis only uses
+        the cache once this is empty.
+        """
+        required = [
+            "organism",
+            "ontologies",
+            "levels",
+            "max-input-panel",
+            "statistics",
+            "grouping",
+            "kappa",
+        ]
+        for cluster in range(1, (self.NUM_CLUSTERS or 1) + 1):
+            required += [("genes", cluster), ("cluster", cluster)]
+        return [setting for setting in required if setting not in self._applied]
 
     def __read_gene_list(self, data):
         gene_ids = []
@@ -96,11 +289,16 @@ class ClueGoClient:
                 gene_ids.append(row[0])
         return gene_ids
 
-    def set_organism(self, organism_name):
+    def set_organism(self, organism_name, force=False):
         """
         organism_name can be one of "Homo Sapiens" or "Mus Musculus" by default.
         Use get_all_organisms to view options; Uploading a new organism can be done with GUI.
+        The PUT is skipped if organism_name is already set, unless force is True.
         """
+        if self.__unchanged("organism", organism_name, force):
+            print("set_organism\tunchanged")
+            self.ORGANISM = organism_name
+            return
         try:
             url = (
                 self.CLUEGO_BASE_URL
@@ -111,11 +309,14 @@ class ClueGoClient:
                 + self.SEP
                 + quote(organism_name)
             )
-            response = requests.put(url)
+            response = self.__put_setting("organism", organism_name, url)
             print(f"set_organism\t{response.status_code}")
             if str(response.status_code).startswith("4"):
                 print(f"\t{response.json()}")
             self.ORGANISM = organism_name
+        except (requests.ConnectionError, requests.Timeout):
+            # connection errors are the caller's to handle (ClueGoPool fails over on them)
+            raise
         except Exception as e:
             print(e)
 
@@ -128,11 +329,15 @@ class ClueGoClient:
                 + self.SEP
                 + "get-all-installed-organisms"
             )
-            response = requests.get(url)
+            response = self.__request(
+                "GET", url, endpoint="organisms/get-all-installed-organisms"
+            )
             print(f"get_all_organisms\t{response.status_code}")
             if str(response.status_code).startswith("4"):
                 print(f"\t{response.json()}")
             return response.json()
+        except (requests.ConnectionError, requests.Timeout):
+            raise
         except Exception as e:
             print(e)
 
@@ -144,9 +349,22 @@ class ClueGoClient:
         min_number_of_genes_per_term=3,
         min_percentage_of_genes_mapped=4,
         no_restrictions=False,
+        force=False,
     ):
+        properties = (
+            node_shape,
+            cluster_color,
+            min_number_of_genes_per_term,
+            min_percentage_of_genes_mapped,
+            no_restrictions,
+        )
+        if self.__unchanged(("cluster", input_panel_index), properties, force):
+            print("set_analysis\tunchanged")
+            return
         try:
-            response = requests.put(
+            response = self.__put_setting(
+                ("cluster", input_panel_index),
+                properties,
                 self.CLUEGO_BASE_URL
                 + self.SEP
                 + "cluster"
@@ -169,6 +387,8 @@ class ClueGoClient:
             print(f"set_analysis\t{response.status_code}")
             if str(response.status_code).startswith("4"):
                 print(f"\t{response.json()}")
+        except (requests.ConnectionError, requests.Timeout):
+            raise
         except Exception as e:
             print(e)
 
@@ -181,15 +401,21 @@ class ClueGoClient:
                 + self.SEP
                 + "get-ontology-info"
             )
-            response = requests.get(url)
+            response = self.__request(
+                "GET", url, endpoint="ontologies/get-ontology-info"
+            )
             print(f"get_ontologies\t{response.status_code}")
             if str(response.status_code).startswith("4"):
                 print(f"\t{response.json()}")
             return response.json()
+        except (requests.ConnectionError, requests.Timeout):
+            raise
         except Exception as e:
             print(e)
 
-    def set_ontologies(self, ontologies=["3;Ellipse", "10;Triangle", "9;Rectangle"]):
+    def set_ontologies(
+        self, ontologies=["3;Ellipse", "10;Triangle", "9;Rectangle"], force=False
+    ):
 
         if ontologies == "Nida":
             ontologies = [
@@ -203,29 +429,59 @@ class ClueGoClient:
                 "10;Triangle",
             ]
 
+        if self.__unchanged("ontologies", tuple(ontologies), force):
+            print("set_ontologies\tunchanged")
+            return
+
         try:
             url = self.SEP.join([self.CLUEGO_BASE_URL, "ontologies", "set-ontologies"])
-            response = requests.put(
-                url=url, json=ontologies, headers={"Content-Type": "application/json"}
+            response = self.__put_setting(
+                "ontologies",
+                tuple(ontologies),
+                url,
+                json=ontologies,
+                headers={"Content-Type": "application/json"},
             )
             print(f"set_ontologies\t{response.status_code}")
             if str(response.status_code).startswith("4"):
                 print(f"\t{response.json()}")
 
+        except (requests.ConnectionError, requests.Timeout):
+            raise
         except Exception as e:
             print(e)
 
-    def set_number_of_clusters(self, num_clusters=1):
-        num_clusters = str(num_clusters)
+    def set_number_of_clusters(self, num_clusters=1, force=False):
+        self.NUM_CLUSTERS = int(num_clusters)
+        if self.__unchanged("max-input-panel", self.NUM_CLUSTERS, force):
+            print("set_number_of_clusters\tunchanged")
+            return
         url = self.SEP.join(
-            [self.CLUEGO_BASE_URL, "cluster", "max-input-panel", num_clusters]
+            [self.CLUEGO_BASE_URL, "cluster", "max-input-panel", str(num_clusters)]
         )
-        response = requests.put(url)
+        response = self.__put_setting("max-input-panel", self.NUM_CLUSTERS, url)
         print(f"set_number_of_clusters\t{response.status_code}")
 
-    def set_gene_ids(self, gene_ids=None, cluster_id=1):
+    def set_visual_style(self, visual_style="ShowGroupDifference", force=False):
+        """
+        visual_style is one of "ShowGroupDifference", "ShowSignificanceDifference" or "ShowClusterDifference"
+        """
+        if self.__unchanged("visual-style", visual_style, force):
+            print("set_visual_style\tunchanged")
+            return
+        url = self.SEP.join(
+            [self.CLUEGO_BASE_URL, "cluster", "select-visual-style", visual_style]
+        )
+        response = self.__put_setting(
+            "visual-style", visual_style, url, headers=self.HEADERS
+        )
+        print(f"set_visual_style\t{response.status_code}")
+
+    def set_gene_ids(self, gene_ids=None, cluster_id=1, id_index=None):
         """
         gene list must be a list, ex. ["NM_001482", "NM_005012", "NM_001033719", "ENST00000271277"]
+        If a gene_index.GeneIdIndex is given, the IDs are mapped to its canonical ID type and
+        deduplicated before upload, and the unmapped ones are reported.
         """
 
         if gene_ids is None:
@@ -236,10 +492,18 @@ class ClueGoClient:
             )
             gene_ids = self.__read_gene_list(path)
 
+        if id_index is not None:
+            gene_ids, unmapped = id_index.resolve(gene_ids)
+            if unmapped:
+                print(f"set_gene_ids\t{len(unmapped)} unmapped ids\t{unmapped[:10]}")
+
+        uploaded = tuple(sorted(set(gene_ids)))
         gene_ids = json.dumps(gene_ids)
 
-        response = requests.put(
-            url=self.SEP.join(
+        response = self.__put_setting(
+            ("genes", cluster_id),
+            uploaded,
+            self.SEP.join(
                 [
                     self.CLUEGO_BASE_URL,
                     "cluster",
@@ -259,16 +523,45 @@ class ClueGoClient:
             except Exception as e:
                 print(e)
 
+    def set_id_type(self, id_type="# Automatic #", force=False):
+        """
+        Tells ClueGO which ID type the uploaded lists use; run get_all_id_types for the options.
+        Setting it explicitly skips ClueGO's automatic detection on every upload.
+        """
+        if self.__unchanged("id-type", id_type, force):
+            print("set_id_type\tunchanged")
+            return
+        url = self.SEP.join(
+            [self.CLUEGO_BASE_URL, "ids", "set-id-type", quote(id_type, safe="")]
+        )
+        response = self.__put_setting("id-type", id_type, url, headers=self.HEADERS)
+        print(f"set_id_type\t{response.status_code}")
+
+    def get_all_id_types(self):
+        url = self.SEP.join([self.CLUEGO_BASE_URL, "ids", "get-all-installed-id-types"])
+        response = self.__request(
+            "GET", url, headers=self.HEADERS, endpoint="ids/get-all-installed-id-types"
+        )
+        print(f"get_all_id_types\t{response.status_code}")
+        return response.json()
+
     def get_network_ids(self):
         try:
 
             url = self.SEP.join([self.CLUEGO_BASE_URL, "get-all-cluego-networks"])
-            response = requests.get(url, headers={"Content-Type": "application/json"})
+            response = self.__request(
+                "GET",
+                url,
+                headers={"Content-Type": "application/json"},
+                endpoint="get-all-cluego-networks",
+            )
             print(f"get_network_ids\t{response.status_code}")
 
             if str(response.status_code).startswith("4"):
                 print(f"\t{response.json()}")
 
+        except (requests.ConnectionError, requests.Timeout):
+            raise
         except Exception as e:
             print(e)
 
@@ -281,6 +574,7 @@ class ClueGoClient:
         preset: str = "Default",
         node_shape: str = "Ellipse",
         cluster_num: int = 1,
+        force: bool = False,
     ):
 
         if preset == "global":
@@ -293,6 +587,17 @@ class ClueGoClient:
             min_num_genes_per_GO_term = 1
             pct_genes_mapped_per_term = 50
 
+        properties = (
+            node_shape,
+            cluster_color,
+            min_num_genes_per_GO_term,
+            pct_genes_mapped_per_term,
+            no_restrictions,
+        )
+        if self.__unchanged(("cluster", cluster_num), properties, force):
+            print("set_analysis_properties_for_cluster\tunchanged")
+            return
+
         url = self.SEP.join(
             [
                 self.CLUEGO_BASE_URL,
@@ -307,15 +612,19 @@ class ClueGoClient:
             ]
         )
         print(url)
-        response = requests.put(url)
-        print(f"get_network_ids\t{response.status_code}")
+        response = self.__put_setting(("cluster", cluster_num), properties, url)
+        print(f"set_analysis_properties_for_cluster\t{response.status_code}")
 
-    def set_min_max_GO_levels(self, min, max, all_levels=False):
+    def set_min_max_GO_levels(self, min, max, all_levels=False, force=False):
         """
         :param min (int) - specifies the minimum GO level permitted
         :param min (int) - specifies the max GO level permitted
         :param all_levels (bool) - specifies if all levels are permitted
+        :param force (bool) - send the levels even if ClueGO already has them
         """
+        if self.__unchanged("levels", (min, max, all_levels), force):
+            print("set_min_max_GO_levels\tunchanged")
+            return
 
         try:
 
@@ -329,127 +638,414 @@ class ClueGoClient:
                     str(all_levels),
                 ]
             )
-            response = requests.put(url, headers={"Content-Type": "application/json"})
+            response = self.__put_setting(
+                "levels",
+                (min, max, all_levels),
+                url,
+                headers={"Content-Type": "application/json"},
+            )
             print(f"set_min_max_GO_levels\t{response.status_code}")
 
             if str(response.status_code).startswith("4"):
                 print(f"\t{response.json()}")
 
+        except (requests.ConnectionError, requests.Timeout):
+            raise
         except Exception as e:
             print(e)
 
-    def run_analysis(self, analysis_name):
-        try:
+    def set_statistics(
+        self,
+        enrichment_type="Enrichment/Depletion (Two-sided hypergeometric test)",
+        multiple_testing_correction=True,
+        use_mid_pvalues=False,
+        use_doubling=False,
+        force=False,
+    ):
+        """
+        enrichment_type is one of "Enrichment (Right-sided hypergeometric test)",
+        "Depletion (Left-sided hypergeometric test)" or "Enrichment/Depletion (Two-sided hypergeometric test)"
+        """
+        value = (enrichment_type, multiple_testing_correction, use_mid_pvalues, use_doubling)
+        if self.__unchanged("statistics", value, force):
+            print("set_statistics\tunchanged")
+            return
+        url = self.SEP.join(
+            [self.CLUEGO_BASE_URL, "stats", quote(enrichment_type, safe="")]
+            + [str(v) for v in value[1:]]
+        )
+        response = self.__put_setting("statistics", value, url, headers=self.HEADERS)
+        print(f"set_statistics\t{response.status_code}")
 
-            option = "Cancel and refine selection"
-            url = self.SEP.join(
-                [self.CLUEGO_BASE_URL, quote(analysis_name), quote(option)]
-            )
-            response = requests.get(url)
+    def set_kappa_score_level(self, kappa_score=0.4, force=False):
+        if self.__unchanged("kappa", kappa_score, force):
+            print("set_kappa_score_level\tunchanged")
+            return
+        url = self.SEP.join(
+            [self.CLUEGO_BASE_URL, "ontologies", "set-kappa-score-level", str(kappa_score)]
+        )
+        response = self.__put_setting("kappa", kappa_score, url, headers=self.HEADERS)
+        print(f"set_kappa_score_level\t{response.status_code}")
+
+    def set_grouping(
+        self,
+        do_grouping=True,
+        coloring_type="Random",
+        group_leading_term="Highest Significance",
+        grouping_type="Kappa Score",
+        init_group_size=1,
+        perc_groups_for_merge=50,
+        perc_terms_for_merge=50,
+        force=False,
+    ):
+        """
+        :param coloring_type (str) - "Random" or "Fix"
+        :param group_leading_term (str) - "Highest Significance", "#Genes / Term", "%Genes / Term" or "%Genes / Term vs Cluster"
+        :param grouping_type (str) - "Kappa Score" or "Tree"
+        """
+        value = (
+            do_grouping,
+            coloring_type,
+            group_leading_term,
+            grouping_type,
+            init_group_size,
+            perc_groups_for_merge,
+            perc_terms_for_merge,
+        )
+        if self.__unchanged("grouping", value, force):
+            print("set_grouping\tunchanged")
+            return
+        url = self.SEP.join(
+            [self.CLUEGO_BASE_URL, "grouping"]
+            + [quote(str(v), safe="") for v in value]
+        )
+        response = self.__put_setting("grouping", value, url, headers=self.HEADERS)
+        print(f"set_grouping\t{response.status_code}")
+
+    def __request_analysis(self, analysis_name, analysis_option, timeout=None):
+        url = self.SEP.join(
+            [self.CLUEGO_BASE_URL, quote(analysis_name), quote(analysis_option)]
+        )
+        # the analysis can take minutes, so by default only the connect timeout applies
+        return self.__request(
+            "GET",
+            url,
+            timeout=(self.transport.timeout[0], timeout),
+            endpoint="{analysis_name}/{analysis_option}",
+        )
+
+    def run_analysis(
+        self,
+        analysis_name,
+        analysis_option="Cancel and refine selection",
+        raise_errors=False,
+    ):
+        """
+        :param analysis_option (str) - what ClueGO does if more than 1000 terms are found:
+        "Continue analysis", "Skip the grouping" or "Cancel and refine selection"
+        :param raise_errors (bool) - raise connection errors and non 2xx answers instead of
+        printing them and returning None, e.g. so ClueGoPool can fail over to another endpoint
+        """
+        try:
+            response = self.__request_analysis(analysis_name, analysis_option)
             print(f"run_analysis\t{response.status_code}")
 
             if str(response.status_code).startswith("4"):
                 print(f"\t{response.json()}")
+            if raise_errors:
+                response.raise_for_status()
+            return response
 
         except Exception as e:
+            if raise_errors:
+                raise
             print(e)
 
-    def set_network_specificity(self, specificity, cluster_num=1):
-        """
-        This function invokes set_min_max_GO_levels and analysis properties for cluster to define to specificity threshold for generating networks.
+    def run_analysis_async(
+        self,
+        analysis_name,
+        analysis_option="Cancel and refine selection",
+        timeout=None,
+    ):
         """
-        assert specificity in ["global", "medium", "detailed", "semi-detailed"]
+        Starts run_analysis on a background thread and returns an AnalysisHandle right away;
+        handle.result() gives the SUID of the new network.
 
-        if specificity == "global":
-            self.set_min_max_GO_levels(1, 4)
-            self.set_analysis_properties_for_cluster(
-                preset=specificity, cluster_num=cluster_num
-            )
-        elif specificity == "medium":
-            self.set_min_max_GO_levels(3, 8)
-            self.set_analysis_properties_for_cluster(
-                preset=specificity, cluster_num=cluster_num
-            )
-        elif specificity == "detailed":
-            self.set_min_max_GO_levels(7, 15)
-            self.set_analysis_properties_for_cluster(
-                preset=specificity, cluster_num=cluster_num
+        :param timeout (float) - seconds to wait for ClueGO before the analysis fails, None waits forever
+        """
+        if self._analysis_executor is None:
+            self._analysis_executor = ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix="cluego-analysis"
             )
-        else:
-            self.set_min_max_GO_levels(6, 12)
-            self.set_analysis_properties_for_cluster(6, 12, cluster_num=cluster_num)
+        handle = AnalysisHandle(self, analysis_name)
+        handle._future = self._analysis_executor.submit(
+            self.__analysis_job, handle, analysis_option, timeout
+        )
+        return handle
 
+    def __analysis_job(self, handle, analysis_option, timeout):
+        response = self.__request_analysis(handle.name, analysis_option, timeout)
+        print(f"run_analysis_async\t{handle.name}\t{response.status_code}")
+        response.raise_for_status()
 
-def color_with_FC(n):
-    """
-    Assumes that the network to be colored is the one currently in cytoscape. Could extend this to work wiht a ID (SUID?)
-    """
+        network_suid = self.get_current_network_suid()
+        if handle._cancel_requested.is_set():
+            # cancelled while ClueGO was computing; don't leave the result behind
+            self.remove_analysis_result(network_suid)
+            raise CancelledError(handle.name)
+        return network_suid
+
+    def remove_analysis_result(self, network_suid):
+        """
+        Removes a ClueGO network from Cytoscape to free memory.
+        """
+        url = self.SEP.join(
+            [self.CLUEGO_BASE_URL, "remove-cluego-analysis-result", str(network_suid)]
+        )
+        response = self.__request(
+            "DELETE", url, endpoint="remove-cluego-analysis-result/{suid}"
+        )
+        print(f"remove_analysis_result\t{response.status_code}")
+        return response
 
-    node_table = cy.get_table_columns("node")
+    def remove_all_analysis_results(self):
+        url = self.SEP.join([self.CLUEGO_BASE_URL, "remove-all-cluego-analysis-results"])
+        response = self.__request(
+            "DELETE", url, endpoint="remove-all-cluego-analysis-results"
+        )
+        print(f"remove_all_analysis_results\t{response.status_code}")
+        return response
 
-    D = get_diffy_expressed_genes(
-        "diff/5s_vs_4s.gene_exp.diff",
-    )[["gene_id", "log2(fold_change)"]]
+    def get_current_network_suid(self):
+        url = self.SEP.join([self.CYTOSCAPE_BASE_URL, "networks", "currentNetwork"])
+        response = self.__request(
+            "GET", url, headers=self.HEADERS, endpoint="networks/currentNetwork"
+        )
+        response.raise_for_status()
+        return response.json()["data"]["networkSUID"]
 
-    node_table = node_table.merge(D, how="left", left_on="ID", right_on="gene_id")
+    def __export_urls(self, network_suid, fmt, number_of_functions=3):
+        """
+        yields (url, file name) pairs for one export format
+        """
+        suid = str(network_suid)
+        results = self.SEP.join([self.CLUEGO_BASE_URL, "analysis-results"])
+        file_name = EXPORT_FORMATS[fmt][0]
+
+        if fmt == "network":
+            yield self.SEP.join(
+                [self.CYTOSCAPE_BASE_URL, "networks", suid, "views", "first.svg"]
+            ), file_name
+        elif fmt == "table":
+            yield self.SEP.join([results, "get-cluego-table", suid]), file_name
+        elif fmt == "main_functions":
+            yield self.SEP.join(
+                [results, "get-main-functions", suid, str(number_of_functions)]
+            ), file_name
+        elif fmt == "gene_table":
+            yield self.SEP.join([results, "get-gene-table", suid]), file_name
+        elif fmt == "kappa_matrix":
+            yield self.SEP.join([results, "get-kappascore-matrix", suid]), file_name
+        elif fmt == "gene_term_matrix":
+            yield self.SEP.join(
+                [results, "get-binary-gene-term-matrix", suid]
+            ), file_name
+        elif fmt == "chart":
+            for cluster in range(1, (self.NUM_CLUSTERS or 1) + 1):
+                yield self.SEP.join(
+                    [
+                        results,
+                        "get-cluego-result-chart",
+                        suid,
+                        str(cluster),
+                        "PieChart",
+                        "svg",
+                    ]
+                ), file_name.format(cluster=cluster)
+
+    def __download(self, fmt, url, path, chunk_size):
+        start = time.perf_counter()
+        size = 0
+        with self.__request(
+            "GET", url, stream=True, endpoint=EXPORT_FORMATS[fmt][1]
+        ) as response:
+            status = response.status_code
+            if str(status).startswith("2"):
+                with open(path, "wb") as f:
+                    for chunk in response.iter_content(chunk_size=chunk_size):
+                        f.write(chunk)
+                        size += len(chunk)
+        return {
+            "format": fmt,
+            "path": path,
+            "status": status,
+            "bytes": size,
+            "seconds": time.perf_counter() - start,
+        }
+
+    def export_results(
+        self,
+        network_suid,
+        formats=None,
+        output_folder=None,
+        max_workers=4,
+        chunk_size=1 << 16,
+        number_of_functions=3,
+    ):
+        """
+        Downloads the results of an analysis concurrently, streaming each body straight to disk.
 
-    node_table["log2(fold_change)"] = node_table["log2(fold_change)"].fillna(0)
+        :param network_suid (int) - SUID of the ClueGO network, see get_current_network_suid
+        :param formats (list) - keys of EXPORT_FORMATS to download, all of them if None
+        :param output_folder (str) - defaults to OUTPUT_FOLDER
+        :param max_workers (int) - number of downloads in flight at once
+        :returns (dict) - manifest with one entry per file (path, status, bytes, seconds)
+        """
+        if formats is None:
+            formats = list(EXPORT_FORMATS)
+        unknown = set(formats) - set(EXPORT_FORMATS)
+        if unknown:
+            raise ValueError(f"unknown export formats {sorted(unknown)}")
+
+        if output_folder is None:
+            output_folder = self.OUTPUT_FOLDER
+        os.makedirs(output_folder, exist_ok=True)
+
+        downloads = [
+            (fmt, url, os.path.join(output_folder, file_name))
+            for fmt in formats
+            for url, file_name in self.__export_urls(
+                network_suid, fmt, number_of_functions
+            )
+        ]
 
-    D = {row["gene_id"]: row["log2(fold_change)"] for _, row in D.iterrows()}
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            files = list(
+                pool.map(lambda d: self.__download(*d, chunk_size), downloads)
+            )
 
-    for idx, row in node_table.iterrows():
-        genes = row.get("Associated Genes Found")
-        if pd.notna(genes):
-            print(100*idx/node_table.shape[0])
-            # ClueGO stores genes as a string like "[COX7A2, RPS29]"
-            genes = genes.strip("[]")
-            gene_list = [g.strip() for g in genes.split(",")]
+        for f in files:
+            print(f"export_results\t{f['format']}\t{f['status']}\t{f['bytes']}")
 
-            gene_list = [g for g in gene_list if g in D.keys()]
-            if gene_list:
-                avg_fc = sum(D[g] for g in gene_list) / len(gene_list)
-                node_table.at[idx, "log2(fold_change)"] = avg_fc
-        
+        return {
+            "network_suid": network_suid,
+            "files": files,
+            "bytes": sum(f["bytes"] for f in files),
+            "seconds": time.perf_counter() - start,
+        }
 
+    def set_network_specificity(self, specificity, cluster_num=1, force=False):
+        """
+        This function invokes set_min_max_GO_levels and analysis properties for cluster to define to specificity threshold for generating networks.
+        The thresholds of each specificity are in SPECIFICITY_PRESETS.
+        """
+        assert specificity in SPECIFICITY_PRESETS
 
-    node_table["log2(fold_change)"] = pd.to_numeric(
-        node_table["log2(fold_change)"], errors="coerce"
-    )
+        min_level, max_level, min_genes, pct_genes = SPECIFICITY_PRESETS[specificity]
+        self.set_min_max_GO_levels(min_level, max_level, force=force)
+        self.set_analysis_properties_for_cluster(
+            min_genes, pct_genes, cluster_num=cluster_num, force=force
+        )
 
-    cy.load_table_data(node_table, data_key_column="name")
 
-    
+class AnalysisHandle:
+    """
+    Future-like handle for an analysis started with ClueGoClient.run_analysis_async.
+    """
 
-####################################################################
-import pandas as pd
-from get_significant_genes import get_diffy_expressed_genes
+    def __init__(self, client, name):
+        self.client = client
+        self.name = name
+        self._future = None
+        self._cancel_requested = threading.Event()
 
+    def result(self, timeout=None):
+        """
+        SUID of the network the analysis created. Raises concurrent.futures.TimeoutError if it is
+        not done within timeout seconds, CancelledError if it was cancelled, or the analysis' error.
+        """
+        return self._future.result(timeout)
 
-n = 150
-gene_list = list(
-    get_diffy_expressed_genes("diff/5s_vs_4s.gene_exp.diff")["gene_id"].head(n)
-)
+    def exception(self, timeout=None):
+        return self._future.exception(timeout)
 
+    def done(self):
+        return self._future.done()
 
-# global stuff
-client = ClueGoClient("test client",host_address="host.docker.internal")
-client.set_organism("Homo Sapiens")
-client.set_number_of_clusters(1)
-client.set_ontologies("Nida")  # default
+    def running(self):
+        return self._future.running()
 
-client.set_gene_ids(gene_list)
-client.set_min_max_GO_levels(1,10,True)
-client.set_analysis_properties_for_cluster(1,50)
+    def cancel(self):
+        """
+        A queued analysis is never sent. ClueGO has no way to stop a running analysis, so one that
+        is already running is allowed to finish and its network is then removed.
+        """
+        if self._future.cancel():
+            return True
+        if self._future.done():
+            return False
+        self._cancel_requested.set()
+        return True
 
-client.run_analysis("30 pct membership - 6 genes")
+    def cancelled(self):
+        return self._future.cancelled() or self._cancel_requested.is_set()
 
+    def add_done_callback(self, fn):
+        """
+        fn(handle) is called once the analysis finishes, fails or is cancelled
+        """
+        self._future.add_done_callback(lambda _: fn(self))
 
 
-# # for params in ["global", "medium" ,"semi-detailed", "detailed"]:
-# #     client.set_gene_ids(gene_list)
-# #     client.set_min_max_GO_levels(7,8)
-# #     client.set_analysis_properties_for_cluster(1, 50)
+def color_with_FC(
+    network=None, diff_file="diff/5s_vs_4s.gene_exp.diff", base_url=None, tables=None
+):
+    """
+    Adds a log2(fold_change) column to the node table of a ClueGO network.
+    Gene nodes get their own fold change, term nodes the mean fold change of their associated genes.
+    Only the nodes whose fold change differs from what Cytoscape already has are uploaded.
+
+    :param network (int) - SUID of the network to color, the current network if None
+    :param diff_file (str) - cuffdiff output holding the fold changes
+    :param base_url (str) - selects the Cytoscape instance, e.g. client.CYTOSCAPE_BASE_URL;
+        py4cytoscape's default if None
+    :param tables (TableSync) - node table snapshots to diff against, table_sync.TABLES if None
+    Returns the upload statistics of TableSync.push.
+    """
+    # heavy imports, only needed here
+    import pandas as pd
+
+    from cluego_table import explode_bracketed
+    from get_significant_genes import get_diffy_expressed_genes
+    from table_sync import TABLES
 
-# #     client.run_analysis(f"{n} | {params}")
+    if tables is None:
+        tables = TABLES
 
-# #     color_with_FC(n)
\ No newline at end of file
+    node_table = tables.snapshot(
+        ["ID", "Associated Genes Found"], network=network, base_url=base_url
+    )
+
+    fc = (
+        get_diffy_expressed_genes(diff_file)
+        .drop_duplicates("gene_id")
+        .set_index("gene_id")["log2(fold_change)"]
+    )
+
+    node_fc = node_table["ID"].map(fc)
+
+    if "Associated Genes Found" in node_table:
+        # ClueGO stores genes as a string like "[COX7A2, RPS29]"; one row per (node, gene)
+        genes = explode_bracketed(node_table["Associated Genes Found"])
+        # mean skips genes without a fold change; terms with none stay NaN and are not updated
+        term_fc = genes.map(fc).groupby(level=0).mean()
+        node_fc.update(term_fc)
+
+    colored = pd.DataFrame(
+        {
+            tables.key_column: node_table[tables.key_column],
+            "log2(fold_change)": pd.to_numeric(node_fc, errors="coerce").fillna(0),
+        }
+    )
+    return tables.push(colored, network=network, base_url=base_url)
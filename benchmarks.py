@@ -0,0 +1,209 @@
+# client-side benchmarks against the mock cyREST/ClueGO server
+#   python benchmarks.py                  run everything, append to bench_results.jsonl
+#   python benchmarks.py --only export    run one benchmark
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import tempfile
+import time
+
+from mock_cyrest import MockCyREST
+
+
+def _commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _timed(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return {
+        "median_seconds": statistics.median(times),
+        "min_seconds": min(times),
+        "repeat": repeat,
+    }
+
+
+def _client(mock):
+    from ClueGoClient import ClueGoClient
+
+    return ClueGoClient(
+        "benchmark client", host_address=mock.host, port_number=mock.port
+    )
+
+
+def _gene_ids(n):
+    return [f"GENE{i}" for i in range(n)]
+
+
+def bench_handshake(mock, repeat):
+    return _timed(lambda: _client(mock).ensure_online(force=True), repeat)
+
+
+def bench_config_pass(mock, repeat):
+    client = _client(mock)
+
+    def config_pass():
+        client.set_organism("Homo Sapiens", force=True)
+        client.set_number_of_clusters(1, force=True)
+        client.set_ontologies("Nida", force=True)
+        client.set_min_max_GO_levels(3, 8, force=True)
+        client.set_analysis_properties_for_cluster(3, 3, force=True)
+        client.set_visual_style(force=True)
+
+    return _timed(config_pass, repeat)
+
+
+def bench_upload(mock, repeat, sizes=(100, 1000, 10000)):
+    client = _client(mock)
+    results = {}
+    for n in sizes:
+        gene_ids = _gene_ids(n)
+        result = _timed(lambda: client.set_gene_ids(gene_ids), repeat)
+        result["genes_per_second"] = n / result["median_seconds"]
+        results[str(n)] = result
+    return results
+
+
+def bench_export(mock, repeat):
+    client = _client(mock)
+    client.run_analysis("benchmark")
+    suid = client.get_current_network_suid()
+    folder = tempfile.mkdtemp(prefix="cluego-bench-")
+    manifests = []
+    result = _timed(
+        lambda: manifests.append(client.export_results(suid, output_folder=folder)),
+        repeat,
+    )
+    result["bytes"] = manifests[-1]["bytes"]
+    result["megabytes_per_second"] = (
+        manifests[-1]["bytes"] / result["median_seconds"] / 1e6
+    )
+    return result
+
+
+def _synthetic_diff(path, n=2000):
+    header = [
+        "test_id", "gene_id", "gene", "locus", "sample_1", "sample_2", "status",
+        "value_1", "value_2", "log2(fold_change)", "test_stat", "p_value",
+        "q_value", "significant",
+    ]
+    with open(path, "w") as f:
+        f.write("\t".join(header) + "\n")
+        for i in range(n):
+            fc = ((i * 7919) % 2000 - 1000) / 100
+            f.write(
+                f"GENE{i}\tGENE{i}\tGENE{i}\tchr1:1-2\t5s\t4s\tOK\t1\t1\t{fc}\t0\t0.001\t0.01\tyes\n"
+            )
+
+
+def bench_sweep(mock, repeat, jobs=8):
+    from sweep import SweepRunner
+
+    client = _client(mock)
+    folder = tempfile.mkdtemp(prefix="cluego-bench-")
+    diff_file = os.path.join(folder, "bench.gene_exp.diff")
+    _synthetic_diff(diff_file)
+    client.OUTPUT_FOLDER = folder
+
+    grid = {
+        "specificity": ["global", "medium", "semi-detailed", "detailed"],
+        "n": [50 * (i + 1) for i in range(jobs // 4)],
+    }
+
+    def sweep():
+        SweepRunner(
+            client, grid, diff_file=diff_file, checkpoint_path=None, color=False
+        ).run()
+
+    result = _timed(sweep, repeat)
+    result["jobs"] = len(grid["specificity"]) * len(grid["n"])
+    result["jobs_per_minute"] = 60 * result["jobs"] / result["median_seconds"]
+    return result
+
+
+BENCHMARKS = {
+    "handshake": bench_handshake,
+    "config_pass": bench_config_pass,
+    "upload": bench_upload,
+    "export": bench_export,
+    "sweep": bench_sweep,
+}
+
+
+def run(names, repeat, latencies=None):
+    results = {}
+    with MockCyREST(latencies=latencies) as mock:
+        for name in names:
+            results[name] = BENCHMARKS[name](mock, repeat)
+    return {
+        "commit": _commit(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "repeat": repeat,
+        "latencies": latencies,
+        "results": results,
+    }
+
+
+def compare(previous, current):
+    """
+    prints the change in median time of every benchmark against a previous run
+    """
+    def medians(run):
+        flat = {}
+        for name, result in run["results"].items():
+            if "median_seconds" in result:
+                flat[name] = result["median_seconds"]
+            else:
+                for key, sub in result.items():
+                    flat[f"{name}[{key}]"] = sub["median_seconds"]
+        return flat
+
+    before, after = medians(previous), medians(current)
+    print(f"compared with {previous['commit']} ({previous['time']})")
+    for name, seconds in after.items():
+        if name in before:
+            change = 100 * (seconds - before[name]) / before[name]
+            print(f"{name:24s}{1000 * seconds:10.2f} ms{change:+8.1f}%")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="ClueGoClient benchmarks")
+    parser.add_argument("--only", nargs="*", choices=list(BENCHMARKS))
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--analysis-latency", type=float)
+    parser.add_argument("--output", default="bench_results.jsonl")
+    args = parser.parse_args()
+
+    latencies = None
+    if args.analysis_latency is not None:
+        latencies = {"analysis": args.analysis_latency}
+    current = run(args.only or list(BENCHMARKS), args.repeat, latencies)
+
+    previous = None
+    if os.path.exists(args.output):
+        with open(args.output) as f:
+            lines = f.read().splitlines()
+        if lines:
+            previous = json.loads(lines[-1])
+    with open(args.output, "a") as f:
+        f.write(json.dumps(current) + "\n")
+
+    print(json.dumps(current["results"], indent=1))
+    if previous is not None:
+        compare(previous, current)
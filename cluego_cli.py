@@ -0,0 +1,80 @@
+# command line entry point for the ClueGoClient workflows
+#   python cluego_cli.py run --n 150 --name "30 pct membership - 6 genes"
+#   python cluego_cli.py sweep --n 50 100 150 200 --endpoints localhost:1234 localhost:1235
+import argparse
+
+from ClueGoClient import ClueGoClient
+
+DIFF_FILE = "diff/5s_vs_4s.gene_exp.diff"
+SPECIFICITIES = ["global", "medium", "semi-detailed", "detailed"]
+
+
+def configure(client):
+    # global stuff
+    client.set_organism("Homo Sapiens")
+    client.set_number_of_clusters(1)
+    client.set_ontologies("Nida")  # default
+
+
+def run(args):
+    from get_significant_genes import get_diffy_expressed_genes
+
+    gene_list = list(get_diffy_expressed_genes(args.diff_file, n=args.n)["gene_id"])
+
+    client = ClueGoClient("test client", host_address=args.host, port_number=args.port)
+    configure(client)
+
+    client.set_gene_ids(gene_list)
+    client.set_min_max_GO_levels(1, 10, True)
+    client.set_analysis_properties_for_cluster(1, 50)
+
+    client.run_analysis(args.name)
+
+
+def sweep(args):
+    # specificity x n sweep, resumable from the checkpoint if it crashes
+    from sweep import SweepRunner
+
+    grid = {"specificity": args.specificity, "n": args.n}
+    if args.endpoints:
+        from pool import ClueGoPool
+
+        pool = ClueGoPool(args.endpoints, "sweep client", setup=configure)
+        runner = SweepRunner(
+            None, grid, diff_file=args.diff_file, checkpoint_path=args.checkpoint
+        )
+        failed = pool.run_sweep(runner)
+        if failed:
+            print(f"{len(failed)} jobs failed")
+        return
+
+    client = ClueGoClient("sweep client", host_address=args.host, port_number=args.port)
+    configure(client)
+    SweepRunner(
+        client, grid, diff_file=args.diff_file, checkpoint_path=args.checkpoint
+    ).run()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="ClueGO analyses through cyREST")
+    parser.add_argument("--host", default="host.docker.internal")
+    parser.add_argument("--port", default="1234")
+    parser.add_argument("--diff-file", default=DIFF_FILE)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="a single analysis")
+    run_parser.add_argument("--n", type=int, default=150)
+    run_parser.add_argument("--name", default="30 pct membership - 6 genes")
+    run_parser.set_defaults(fn=run)
+
+    sweep_parser = commands.add_parser("sweep", help="specificity x n grid")
+    sweep_parser.add_argument("--n", type=int, nargs="+", default=[50, 100, 150, 200])
+    sweep_parser.add_argument("--specificity", nargs="+", default=SPECIFICITIES)
+    sweep_parser.add_argument("--checkpoint", default="sweep_checkpoint.json")
+    sweep_parser.add_argument(
+        "--endpoints", nargs="*", help="host:port of several Cytoscape instances"
+    )
+    sweep_parser.set_defaults(fn=sweep)
+
+    args = parser.parse_args()
+    args.fn(args)
@@ -0,0 +1,184 @@
+# ClueGO result table (get-cluego-table export) -> CSR term x gene matrix plus typed term columns
+import io
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from enrichment import GeneTermMatrix
+
+# attribute -> ClueGO column; "*" matches the rest of the name, e.g. the correction method
+COLUMNS = {
+    "term_names": "Term",
+    "ontology": "Ontology Source",
+    "p_value": "Term PValue",
+    "p_corrected": "Term PValue Corrected*",
+    "group_p_value": "Group PValue",
+    "group_p_corrected": "Group PValue Corrected*",
+    "pct_genes": "% Associated Genes",
+    "nr_genes": "Nr. Genes",
+}
+
+DTYPES = {
+    "p_value": np.float64,
+    "p_corrected": np.float64,
+    "group_p_value": np.float64,
+    "group_p_corrected": np.float64,
+    "pct_genes": np.float32,
+    "nr_genes": np.int32,
+}
+
+
+def explode_bracketed(values):
+    """
+    ClueGO list cells like "[COX7A2, RPS29]" -> one stripped item per row, indexed by the row
+    each item came from; empty lists and missing cells give no rows
+    """
+    items = values.dropna().astype(str).str.strip("[]").str.split(",").explode().str.strip()
+    return items[items.notna() & (items != "")]
+
+
+def _column(header, pattern):
+    if pattern.endswith("*"):
+        return next((c for c in header if c.startswith(pattern[:-1])), None)
+    return pattern if pattern in header else None
+
+
+class ClueGoTable:
+    """
+    A parsed ClueGO result table. annotation is a GeneTermMatrix with one row per table row
+    (same order as terms), so the typed arrays below line up with its rows:
+
+    - p_value, p_corrected, group_p_value, group_p_corrected - float64
+    - pct_genes - float32, nr_genes - int32
+    - go_level_min, go_level_max - int16, -1 for terms without a GO level
+    - ontology - categorical ontology source
+    - groups - the GOGroups cell of each term, as a list
+    """
+
+    def __init__(self, annotation, columns, groups):
+        self.annotation = annotation
+        self.terms = annotation.terms
+        self.groups = groups
+        for name, values in columns.items():
+            setattr(self, name, values)
+
+    def __len__(self):
+        return len(self.terms)
+
+    @classmethod
+    def from_file(cls, filepath, chunk_rows=10000):
+        with open(filepath) as f:
+            return cls.from_lines(f, chunk_rows)
+
+    @classmethod
+    def from_lines(cls, lines, chunk_rows=10000):
+        """
+        Parses any iterable of lines (str or bytes), e.g. response.iter_lines() of a streamed
+        get-cluego-table download, chunk_rows lines at a time.
+        """
+        lines = iter(lines)
+        header = next(lines, None)
+        if isinstance(header, bytes):
+            header = header.decode()
+        if header is None or not header.strip():
+            raise ValueError("empty ClueGO table")
+        header = header.rstrip("\r\n")
+
+        frames = []
+        batch = []
+        for line in lines:
+            if isinstance(line, bytes):
+                line = line.decode()
+            batch.append(line.rstrip("\r\n"))
+            if len(batch) >= chunk_rows:
+                frames.append(cls.__parse(header, batch))
+                batch = []
+        if batch or not frames:
+            frames.append(cls.__parse(header, batch))
+        return cls.from_frame(pd.concat(frames, ignore_index=True))
+
+    @staticmethod
+    def __parse(header, batch):
+        text = "\n".join([header] + [line for line in batch if line.strip()])
+        return pd.read_csv(io.StringIO(text), delimiter="\t", dtype=str)
+
+    @classmethod
+    def from_frame(cls, table):
+        """
+        from a ClueGO table already read as strings, e.g. pd.read_csv(..., dtype=str)
+        """
+        table = table.reset_index(drop=True)
+        header = list(table.columns)
+
+        genes = explode_bracketed(table["Associated Genes Found"])
+        gene_codes, gene_labels = pd.factorize(genes)
+        matrix = sparse.csr_matrix(
+            (
+                np.ones(len(gene_codes), dtype=np.int32),
+                (genes.index.to_numpy(), gene_codes),
+            ),
+            shape=(len(table), len(gene_labels)),
+        )
+        matrix.data[:] = 1
+
+        columns = {}
+        for name, pattern in COLUMNS.items():
+            column = _column(header, pattern)
+            values = (
+                table[column]
+                if column is not None
+                else pd.Series(np.nan, index=table.index, dtype=object)
+            )
+            if name in DTYPES:
+                values = pd.to_numeric(values.astype(str).str.strip("% "), errors="coerce")
+                if np.issubdtype(DTYPES[name], np.integer):
+                    values = values.fillna(-1)
+                columns[name] = values.to_numpy(DTYPES[name])
+            elif name == "ontology":
+                columns[name] = pd.Categorical(values)
+            else:
+                columns[name] = values.to_numpy(dtype=object)
+
+        levels = pd.Series(index=table.index, dtype=np.float64)
+        if "GOLevels" in table:
+            levels = pd.to_numeric(explode_bracketed(table["GOLevels"]), errors="coerce")
+        by_term = levels.groupby(level=0)
+        for name, level in (("go_level_min", by_term.min()), ("go_level_max", by_term.max())):
+            columns[name] = level.reindex(table.index).fillna(-1).to_numpy(np.int16)
+
+        groups = [[] for _ in range(len(table))]
+        if "GOGroups" in table:
+            for row, group in explode_bracketed(table["GOGroups"]).items():
+                groups[row].append(group)
+
+        terms = table["ID"].to_numpy(dtype=object) if "ID" in table else table.index
+        term_names = dict(zip(terms, columns["term_names"]))
+        annotation = GeneTermMatrix(matrix, terms, gene_labels, term_names)
+        return cls(annotation, columns, groups)
+
+    def to_frame(self):
+        """
+        one row per term with the typed columns, genes as a count
+        """
+        frame = pd.DataFrame(
+            {
+                name: getattr(self, name)
+                for name in list(COLUMNS) + ["go_level_min", "go_level_max"]
+            },
+            index=pd.Index(self.terms, name="term"),
+        )
+        frame["genes_found"] = self.annotation.term_sizes
+        return frame
+
+    def term_means(self, values):
+        """
+        Mean of a per-gene value (a Series indexed by gene, e.g. log2 fold changes) over the
+        genes of each term, NaN for terms none of whose genes have a value.
+        """
+        vector = pd.Series(self.annotation.genes).map(values).to_numpy(np.float64)
+        known = ~np.isnan(vector)
+        totals = self.annotation.matrix @ np.where(known, vector, 0.0)
+        counts = self.annotation.matrix @ known.astype(np.int32)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(counts > 0, totals / counts, np.nan)
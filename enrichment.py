@@ -0,0 +1,417 @@
+# local, vectorized gene set enrichment; an offline alternative to ClueGO / g:Profiler
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from scipy.stats import hypergeom
+
+TESTS = ["right", "left", "two-sided"]
+CORRECTIONS = [None, "bonferroni", "holm", "bh"]
+
+
+class GeneTermMatrix:
+    """
+    Binary term x gene membership stored as a CSR matrix, with the term and gene names interned
+    as arrays; gene_index maps a gene name to its column.
+    """
+
+    def __init__(self, matrix, terms, genes, term_names=None):
+        self.matrix = sparse.csr_matrix(matrix, dtype=np.int32, copy=True)
+        self.matrix.data[:] = 1
+        self.terms = np.asarray(terms, dtype=object)
+        self.genes = np.asarray(genes, dtype=object)
+        self.term_names = term_names
+        self.gene_index = {gene: i for i, gene in enumerate(self.genes)}
+        self.term_sizes = self.matrix.getnnz(axis=1)
+
+    @property
+    def shape(self):
+        return self.matrix.shape
+
+    @classmethod
+    def from_pairs(cls, terms, genes, term_names=None):
+        """
+        builds the matrix from parallel sequences of (term, gene) memberships
+        """
+        term_codes, term_labels = pd.factorize(pd.Series(terms, dtype=object))
+        gene_codes, gene_labels = pd.factorize(pd.Series(genes, dtype=object))
+        matrix = sparse.csr_matrix(
+            (np.ones(len(term_codes), dtype=np.int32), (term_codes, gene_codes)),
+            shape=(len(term_labels), len(gene_labels)),
+        )
+        # duplicate pairs were summed, membership is binary
+        matrix.data[:] = 1
+        return cls(matrix, term_labels, gene_labels, term_names)
+
+    @classmethod
+    def from_gmt(cls, filepath):
+        """
+        GMT: one term per line, "term<TAB>description<TAB>gene<TAB>gene..."
+        """
+        terms, genes, names = [], [], {}
+        with open(filepath) as f:
+            for line in f:
+                fields = line.rstrip("\n").split("\t")
+                if len(fields) < 3:
+                    continue
+                names[fields[0]] = fields[1]
+                terms.extend([fields[0]] * (len(fields) - 2))
+                genes.extend(fields[2:])
+        return cls.from_pairs(terms, genes, names)
+
+    @classmethod
+    def from_binary_matrix(cls, filepath, chunksize=5000):
+        """
+        Reads ClueGO's binary gene-term matrix export (get-binary-gene-term-matrix): a tab separated
+        table with one row per gene, one column per term and 0/1 entries. Read in chunks of rows
+        so the dense text is never held in memory at once.
+        """
+        blocks, genes = [], []
+        terms = None
+        for chunk in pd.read_csv(
+            filepath, delimiter="\t", index_col=0, chunksize=chunksize
+        ):
+            terms = chunk.columns
+            genes.extend(chunk.index.astype(str))
+            blocks.append(sparse.csr_matrix(chunk.to_numpy(dtype=np.int8)))
+        gene_by_term = sparse.vstack(blocks, format="csr")
+        return cls(gene_by_term.T.tocsr(), terms, genes)
+
+    def query_matrix(self, gene_lists):
+        """
+        lists x genes binary matrix of the genes in each list that are annotated; unknown genes are dropped
+        """
+        rows, cols = [], []
+        for row, gene_list in enumerate(gene_lists):
+            columns = {self.gene_index[g] for g in gene_list if g in self.gene_index}
+            rows.extend([row] * len(columns))
+            cols.extend(columns)
+        return sparse.csr_matrix(
+            (np.ones(len(rows), dtype=np.int32), (rows, cols)),
+            shape=(len(gene_lists), len(self.genes)),
+        )
+
+
+def hypergeom_pvalues(k, M, n, N, test="right"):
+    """
+    :param k - number of list genes in the term
+    :param M - number of annotated genes (the universe)
+    :param n - number of genes in the term
+    :param N - number of annotated genes in the list
+    :param test (str) - "right" (enrichment), "left" (depletion) or "two-sided" (doubling the smaller tail)
+    """
+    if test == "right":
+        return hypergeom.sf(k - 1, M, n, N)
+    if test == "left":
+        return hypergeom.cdf(k, M, n, N)
+    if test == "two-sided":
+        tail = np.minimum(hypergeom.sf(k - 1, M, n, N), hypergeom.cdf(k, M, n, N))
+        return np.minimum(1.0, 2 * tail)
+    raise ValueError(f"test must be one of {TESTS}")
+
+
+def bonferroni(p):
+    """
+    row-wise Bonferroni correction; NaN entries are untested and do not count
+    """
+    p = np.atleast_2d(p)
+    m = np.sum(~np.isnan(p), axis=1, keepdims=True)
+    return np.minimum(1.0, p * m)
+
+
+def holm(p):
+    """
+    row-wise Bonferroni step-down (Holm) correction, ClueGO's default; NaN entries are untested
+    and do not count
+    """
+    p = np.atleast_2d(np.asarray(p, dtype=np.float64))
+    m = np.sum(~np.isnan(p), axis=1, keepdims=True)
+
+    # NaNs sort last, so the first m entries of each row are the tested ones
+    order = np.argsort(p, axis=1)
+    ranked = np.take_along_axis(p, order, axis=1)
+    ranks = np.arange(p.shape[1])
+    q = ranked * (m - ranks)
+    # enforce monotonicity from the smallest p up; fmax ignores the trailing NaNs
+    q = np.fmax.accumulate(q, axis=1)
+    q = np.minimum(1.0, q)
+    q[np.isnan(ranked)] = np.nan
+
+    corrected = np.empty_like(q)
+    np.put_along_axis(corrected, order, q, axis=1)
+    return corrected
+
+
+def benjamini_hochberg(p):
+    """
+    row-wise Benjamini-Hochberg correction; NaN entries are untested and do not count
+    """
+    p = np.atleast_2d(np.asarray(p, dtype=np.float64))
+    m = np.sum(~np.isnan(p), axis=1, keepdims=True)
+
+    # NaNs sort last, so the first m entries of each row are the tested ones
+    order = np.argsort(p, axis=1)
+    ranked = np.take_along_axis(p, order, axis=1)
+    ranks = np.arange(1, p.shape[1] + 1)
+    q = ranked * m / ranks
+    # enforce monotonicity from the largest p down; fmin ignores the trailing NaNs
+    q = np.fmin.accumulate(q[:, ::-1], axis=1)[:, ::-1]
+    q = np.minimum(1.0, q)
+    q[np.isnan(ranked)] = np.nan
+
+    corrected = np.empty_like(q)
+    np.put_along_axis(corrected, order, q, axis=1)
+    return corrected
+
+
+# multiple testing correction functions by CORRECTIONS name (None leaves p unchanged)
+CORRECTORS = {"bonferroni": bonferroni, "holm": holm, "bh": benjamini_hochberg}
+
+
+def correct(p, method):
+    """
+    row-wise multiple testing correction of p with one of CORRECTIONS; NaN entries are
+    untested and do not count. Always returns a 2d array, like the corrections themselves.
+    """
+    if method not in CORRECTIONS:
+        raise ValueError(f"correction must be one of {CORRECTIONS}")
+    if method is None:
+        return np.atleast_2d(np.asarray(p, dtype=np.float64))
+    return CORRECTORS[method](p)
+
+
+def term_filter(k, n, min_number_of_genes_per_term=3, min_percentage_of_genes_mapped=4):
+    """
+    the per-cluster term restrictions of ClueGoClient.set_analysis_properties_for_cluster
+    """
+    pct = 100 * k / np.maximum(n, 1)
+    return (k >= max(min_number_of_genes_per_term, 1)) & (
+        pct >= min_percentage_of_genes_mapped
+    )
+
+
+def enrich(
+    annotation,
+    gene_lists,
+    test="right",
+    correction="bh",
+    min_number_of_genes_per_term=3,
+    min_percentage_of_genes_mapped=4,
+    no_restrictions=False,
+):
+    """
+    Hypergeometric enrichment of many gene lists at once against a GeneTermMatrix.
+
+    :param gene_lists - dict of name -> genes, or a list of gene lists (named 0, 1, ...)
+    :param test (str) - "right", "left" or "two-sided", see hypergeom_pvalues
+    :param correction (str) - None, "bonferroni", "holm" or "bh", applied per list over the terms passing the filter
+    :param no_restrictions (bool) - skip the gene count / percentage filter (terms with no hits are still dropped)
+    :returns (pd.DataFrame) - one row per (list, term) passing the filter
+    """
+    if correction not in CORRECTIONS:
+        raise ValueError(f"correction must be one of {CORRECTIONS}")
+    if not isinstance(gene_lists, dict):
+        gene_lists = dict(enumerate(gene_lists))
+    names = list(gene_lists)
+
+    Q = annotation.query_matrix([gene_lists[name] for name in names])
+    k = (Q @ annotation.matrix.T).toarray()
+    M = annotation.shape[1]
+    n = annotation.term_sizes[np.newaxis, :]
+    N = np.asarray(Q.sum(axis=1))
+
+    if no_restrictions:
+        tested = k > 0
+    else:
+        tested = term_filter(
+            k, n, min_number_of_genes_per_term, min_percentage_of_genes_mapped
+        )
+
+    p = np.full(k.shape, np.nan)
+    p[tested] = hypergeom_pvalues(
+        k[tested],
+        M,
+        np.broadcast_to(n, k.shape)[tested],
+        np.broadcast_to(N, k.shape)[tested],
+        test,
+    )
+
+    corrected = correct(p, correction)
+
+    rows, cols = np.nonzero(tested)
+    result = pd.DataFrame(
+        {
+            "list": np.asarray(names, dtype=object)[rows],
+            "term": annotation.terms[cols],
+            "overlap": k[rows, cols],
+            "term_size": annotation.term_sizes[cols],
+            "list_size": N[rows, 0],
+            "pct_genes": 100 * k[rows, cols] / annotation.term_sizes[cols],
+            "p_value": p[rows, cols],
+            "p_corrected": corrected[rows, cols],
+        }
+    )
+    if annotation.term_names is not None:
+        result.insert(2, "term_name", result["term"].map(annotation.term_names))
+    return result.sort_values(["list", "p_value"], ignore_index=True)
+
+
+class IncrementalEnrichment:
+    """
+    Enrichment of one gene set that grows or shrinks, e.g. the top n genes for increasing n.
+    Per-term overlap counts are kept between calls; adding or removing genes only touches the
+    terms those genes belong to, O(changed genes x their term degree). P-values are then
+    recomputed for the terms passing the filter only, never for the (usually many) terms
+    without enough hits. Results match enrich() for the same gene set and parameters.
+    """
+
+    def __init__(
+        self,
+        annotation,
+        test="right",
+        correction="bh",
+        min_number_of_genes_per_term=3,
+        min_percentage_of_genes_mapped=4,
+        no_restrictions=False,
+    ):
+        if correction not in CORRECTIONS:
+            raise ValueError(f"correction must be one of {CORRECTIONS}")
+        self.annotation = annotation
+        self.test = test
+        self.correction = correction
+        self.min_number_of_genes_per_term = min_number_of_genes_per_term
+        self.min_percentage_of_genes_mapped = min_percentage_of_genes_mapped
+        self.no_restrictions = no_restrictions
+
+        # gene -> terms lookups read columns of the term x gene matrix
+        self._by_gene = annotation.matrix.tocsc()
+        self.members = np.zeros(annotation.shape[1], dtype=bool)
+        self.overlap = np.zeros(annotation.shape[0], dtype=np.int64)
+
+    @property
+    def list_size(self):
+        """
+        number of annotated genes in the set
+        """
+        return int(self.members.sum())
+
+    def __columns(self, genes):
+        index = self.annotation.gene_index
+        return np.unique(
+            np.fromiter((index[g] for g in genes if g in index), dtype=np.int64)
+        )
+
+    def __update(self, columns, delta):
+        self.members[columns] = delta > 0
+        terms = self._by_gene[:, columns].indices
+        np.add.at(self.overlap, terms, delta)
+
+    def clear(self):
+        self.members[:] = False
+        self.overlap[:] = 0
+
+    def add(self, genes):
+        columns = self.__columns(genes)
+        self.__update(columns[~self.members[columns]], 1)
+
+    def remove(self, genes):
+        columns = self.__columns(genes)
+        self.__update(columns[self.members[columns]], -1)
+
+    def results(self):
+        """
+        the enrich() rows of the current gene set, without the "list" column
+        """
+        k = self.overlap
+        if self.no_restrictions:
+            tested = np.flatnonzero(k > 0)
+        else:
+            candidates = np.flatnonzero(k >= max(self.min_number_of_genes_per_term, 1))
+            tested = candidates[
+                term_filter(
+                    k[candidates],
+                    self.annotation.term_sizes[candidates],
+                    self.min_number_of_genes_per_term,
+                    self.min_percentage_of_genes_mapped,
+                )
+            ]
+
+        N = self.list_size
+        n = self.annotation.term_sizes[tested]
+        # many terms share an (overlap, term size) pair, the p-value is computed once per pair
+        pairs, inverse = np.unique(
+            k[tested] * (int(n.max(initial=0)) + 1) + n, return_inverse=True
+        )
+        first = np.zeros(len(pairs), dtype=np.int64)
+        first[inverse] = np.arange(len(inverse))
+        p = hypergeom_pvalues(
+            k[tested][first], self.annotation.shape[1], n[first], N, self.test
+        )
+        p = np.asarray(p, dtype=np.float64)[inverse]
+        corrected = correct(p, self.correction)[0]
+
+        result = pd.DataFrame(
+            {
+                "term": self.annotation.terms[tested],
+                "overlap": k[tested],
+                "term_size": n,
+                "list_size": N,
+                "pct_genes": 100 * k[tested] / n,
+                "p_value": p,
+                "p_corrected": corrected,
+            }
+        )
+        if self.annotation.term_names is not None:
+            result.insert(1, "term_name", result["term"].map(self.annotation.term_names))
+        return result.sort_values("p_value", ignore_index=True)
+
+    def curve(self, ranked_genes, ns, max_p=0.05):
+        """
+        Enrichment of the top n of ranked_genes for every n in ns, moving from one n to the next
+        by adding or removing only the genes in between. Returns the rows of results() with
+        p_corrected <= max_p (all rows if max_p is None) and an "n" column.
+        The gene set is cleared first and holds the top ns[-1] genes afterwards.
+        """
+        ranked_genes = list(ranked_genes)
+        frames = []
+        self.clear()
+        current = 0
+        for n in ns:
+            if n > current:
+                self.add(ranked_genes[current:n])
+            elif n < current:
+                self.remove(ranked_genes[n:current])
+            current = n
+            result = self.results()
+            if max_p is not None:
+                result = result[result["p_corrected"] <= max_p]
+            frames.append(result.assign(n=n))
+        if not frames:
+            return pd.DataFrame()
+        return pd.concat(frames, ignore_index=True)
+
+
+if __name__ == "__main__":
+    # python enrichment.py - checks IncrementalEnrichment against enrich() on random annotations
+    rng = np.random.default_rng(0)
+    genes = np.array([f"G{i}" for i in range(2000)], dtype=object)
+    pairs = [
+        (f"T{t}", g)
+        for t in range(300)
+        for g in rng.choice(genes, rng.integers(5, 200))
+    ]
+    annotation = GeneTermMatrix.from_pairs(*zip(*pairs))
+    ranked = list(rng.permutation(genes))
+    ns = [50, 400, 150, 0, 300]
+
+    incremental = IncrementalEnrichment(annotation)
+    curve = incremental.curve(ranked, ns, max_p=None)
+    again = incremental.curve(ranked, ns, max_p=None)
+    assert curve.equals(again), "curve depends on the gene set left by a previous call"
+    for n in ns:
+        # terms with equal p-values may come in either order
+        expected = enrich(annotation, [ranked[:n]]).drop(columns="list")
+        expected = expected.sort_values("term", ignore_index=True)
+        got = curve[curve["n"] == n].drop(columns="n")
+        got = got.sort_values("term", ignore_index=True)
+        pd.testing.assert_frame_equal(got, expected, check_dtype=False)
+    print(f"IncrementalEnrichment matches enrich() for n in {ns}")
@@ -0,0 +1,242 @@
+# several cuffdiff outputs as one memory-mapped feature x contrast float32 matrix
+#   python expression_store.py build <folder> [diff files]
+#   python expression_store.py info <folder>
+import json
+import os
+import shutil
+import sys
+
+import numpy as np
+import pandas as pd
+from numpy.lib.format import open_memmap
+
+from folders import replace_folder
+from get_significant_genes import CUFFDIFF_OUTPUTS, load_cuffdiff
+
+# matrix name -> cuffdiff column
+VALUES = {
+    "log2fc": "log2(fold_change)",
+    "p_value": "p_value",
+    "q_value": "q_value",
+}
+
+
+def contrast_name(filepath):
+    """
+    diff/5s_vs_4s.gene_exp.diff -> 5s_vs_4s.gene_exp
+    """
+    name = os.path.basename(filepath)
+    return name[: -len(".diff")] if name.endswith(".diff") else name
+
+
+class ExpressionStore:
+    """
+    Rows are the features (key column, test_id by default) of every ingested cuffdiff file,
+    sorted, so the row of a feature is its position in keys.npy. Columns are the contrasts,
+    one per file. On disk in folder:
+
+    - keys.npy - sorted feature IDs; gene_ids.npy - gene_id of each feature
+    - log2fc.npy, p_value.npy, q_value.npy - float32, NaN where a contrast lacks a feature
+    - significant.npy - bool
+    - meta.json - contrasts and the mtime/size of their source files, written last
+
+    Every array is memory-mapped, so opening the store is free and worker processes share
+    the same pages. Slices of rows are views, not copies.
+    """
+
+    def __init__(self, folder):
+        self.folder = folder
+        with open(os.path.join(folder, "meta.json")) as f:
+            self.meta = json.load(f)
+        self.contrasts = [c["name"] for c in self.meta["contrasts"]]
+        self.keys = self.__load("keys")
+        self.gene_ids = self.__load("gene_ids")
+        self.significant = self.__load("significant")
+        self.values = {name: self.__load(name) for name in VALUES}
+
+    def __load(self, name):
+        return np.load(os.path.join(self.folder, name + ".npy"), mmap_mode="r")
+
+    @staticmethod
+    def build(files, folder, key="test_id"):
+        """
+        Ingests cuffdiff files into a new store in folder. Distribution tests without a
+        log2(fold_change) column (cds, promoters, splicing) get NaN fold changes.
+        A feature listed twice in one file keeps its first row.
+        """
+        wanted = [key, "gene_id", "significant"] + list(VALUES.values())
+        tables = []
+        for filepath in files:
+            header = pd.read_csv(filepath, delimiter="\t", nrows=0).columns
+            D = load_cuffdiff(filepath, [c for c in wanted if c in header])
+            tables.append(D.drop_duplicates(key))
+
+        keys = np.unique(
+            np.concatenate([t[key].to_numpy(dtype=str) for t in tables])
+            if tables
+            else np.empty(0, dtype=str)
+        )
+        shape = (len(keys), len(tables))
+
+        # built next to folder and moved in whole: a rebuild never truncates the files of a
+        # store that other processes have memory-mapped
+        tmp = f"{folder}.tmp-{os.getpid()}"
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+        try:
+            ExpressionStore.__write(files, tables, tmp, key, keys, shape)
+        except BaseException:
+            shutil.rmtree(tmp, ignore_errors=True)
+            raise
+        replace_folder(tmp, folder)
+        return ExpressionStore(folder)
+
+    @staticmethod
+    def __write(files, tables, tmp, key, keys, shape):
+        np.save(os.path.join(tmp, "keys.npy"), keys)
+        gene_ids = np.full(len(keys), "", dtype=object)
+
+        arrays = {
+            name: open_memmap(
+                os.path.join(tmp, name + ".npy"), "w+", np.float32, shape
+            )
+            for name in VALUES
+        }
+        significant = open_memmap(
+            os.path.join(tmp, "significant.npy"), "w+", np.bool_, shape
+        )
+        for array in arrays.values():
+            array[:] = np.nan
+        significant[:] = False
+
+        contrasts = []
+        for j, (filepath, D) in enumerate(zip(files, tables)):
+            rows = np.searchsorted(keys, D[key].to_numpy(dtype=str))
+            for name, column in VALUES.items():
+                if column in D:
+                    arrays[name][rows, j] = D[column].to_numpy(np.float32)
+            significant[rows, j] = (D["significant"] == "yes").to_numpy()
+
+            unset = gene_ids[rows] == ""
+            gene_ids[rows[unset]] = D["gene_id"].to_numpy(dtype=str)[unset]
+
+            stat = os.stat(filepath)
+            contrasts.append(
+                {
+                    "name": contrast_name(filepath),
+                    "source": os.path.abspath(filepath),
+                    "mtime_ns": stat.st_mtime_ns,
+                    "size": stat.st_size,
+                    "features": len(D),
+                }
+            )
+
+        for array in list(arrays.values()) + [significant]:
+            array.flush()
+        np.save(os.path.join(tmp, "gene_ids.npy"), gene_ids.astype(str))
+        with open(os.path.join(tmp, "meta.json"), "w") as f:
+            json.dump({"key": key, "shape": shape, "contrasts": contrasts}, f)
+
+    @staticmethod
+    def open(files, folder, key="test_id"):
+        """
+        opens the store in folder, rebuilding it first if it is missing, holds other files or
+        any source changed since it was built
+        """
+        try:
+            store = ExpressionStore(folder)
+        except (OSError, ValueError):
+            return ExpressionStore.build(files, folder, key)
+        if store.is_stale(files, key):
+            return ExpressionStore.build(files, folder, key)
+        return store
+
+    def is_stale(self, files=None, key="test_id"):
+        if self.meta["key"] != key:
+            return True
+        sources = [c["source"] for c in self.meta["contrasts"]]
+        if files is not None and sources != [os.path.abspath(f) for f in files]:
+            return True
+        for contrast in self.meta["contrasts"]:
+            try:
+                stat = os.stat(contrast["source"])
+            except OSError:
+                return True
+            if (stat.st_mtime_ns, stat.st_size) != (
+                contrast["mtime_ns"],
+                contrast["size"],
+            ):
+                return True
+        return False
+
+    @property
+    def shape(self):
+        return tuple(self.meta["shape"])
+
+    def rows(self, keys):
+        """
+        row of each feature ID, -1 if it is not in the store
+        """
+        query = np.asarray(list(keys), dtype=str)
+        if len(self.keys) == 0 or len(query) == 0:
+            return np.full(len(query), -1)
+        pos = np.minimum(np.searchsorted(self.keys, query), len(self.keys) - 1)
+        return np.where(self.keys[pos] == query, pos, -1)
+
+    def columns(self, contrasts):
+        return np.array([self.contrasts.index(c) for c in contrasts], dtype=np.intp)
+
+    def matrix(self, value="log2fc", rows=None, contrasts=None):
+        """
+        The value matrix restricted to rows (positions or a slice) and contrasts (names).
+        A slice of rows is a view of the memory map; positions are gathered.
+        """
+        array = self.significant if value == "significant" else self.values[value]
+        if rows is not None:
+            array = array[rows]
+        if contrasts is not None:
+            array = array[:, self.columns(contrasts)]
+        return array
+
+    def frame(self, keys, contrasts=None, value="log2fc"):
+        """
+        DataFrame of value for the given features (rows) and contrasts (columns); unknown
+        features are left out
+        """
+        rows = self.rows(keys)
+        rows = rows[rows >= 0]
+        contrasts = self.contrasts if contrasts is None else list(contrasts)
+        return pd.DataFrame(
+            self.matrix(value, rows, contrasts),
+            index=pd.Index(self.keys[rows], name=self.meta["key"]),
+            columns=contrasts,
+        )
+
+    def gene_list(self, contrast, n=None, significant_only=True):
+        """
+        gene_ids of a contrast's features by decreasing absolute log2 fold change, the top n
+        only if n is given; features without a finite fold change are left out
+        """
+        from topk import top_k_indices
+
+        j = self.contrasts.index(contrast)
+        scores = np.array(self.values["log2fc"][:, j], dtype=np.float64)
+        scores[~np.isfinite(scores)] = np.nan
+        if significant_only:
+            scores[~self.significant[:, j]] = np.nan
+        k = np.count_nonzero(~np.isnan(scores)) if n is None else n
+        return [str(g) for g in self.gene_ids[top_k_indices(scores, k)]]
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3 or sys.argv[1] not in ("build", "info"):
+        print("usage: python expression_store.py build <folder> [diff files]")
+        print("       python expression_store.py info <folder>")
+        sys.exit(1)
+    if sys.argv[1] == "build":
+        store = ExpressionStore.build(sys.argv[3:] or CUFFDIFF_OUTPUTS, sys.argv[2])
+    else:
+        store = ExpressionStore(sys.argv[2])
+    print(f"{store.shape[0]} features x {store.shape[1]} contrasts")
+    for contrast in store.meta["contrasts"]:
+        print(f"{contrast['name']}\t{contrast['features']}")
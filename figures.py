@@ -0,0 +1,141 @@
+# renders batches of heatmaps / FC histograms in parallel, skipping figures whose data did not change
+#   python figures.py                                  every contrast in FIGURE_TYPES, into figs/
+#   python figures.py diff/5s_vs_4s.gene_exp.diff --n 50
+import argparse
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from get_significant_genes import (
+    get_diffy_expressed_genes,
+    make_heatmaps,
+    make_histogram,
+)
+
+FIGURES = {
+    "heatmap": lambda D, n, output: make_heatmaps(D, n, output),
+    "histogram": lambda D, n, output: make_histogram(
+        D if n is None else D.head(n), output
+    ),
+}
+
+# the cuffdiff outputs heatmaps.py looks at
+FIGURE_TYPES = ["cds_exp", "gene_exp", "isoform_exp"]
+
+MANIFEST = "figures.json"
+
+
+def figure_path(spec, output_folder):
+    """
+    {"diff_file": "diff/5s_vs_4s.gene_exp.diff", "kind": "heatmap", "n": 30}
+        -> output_folder/5s_vs_4s.gene_exp_heatmap_30.png
+    """
+    stem = os.path.basename(spec["diff_file"])
+    if stem.endswith(".diff"):
+        stem = stem[: -len(".diff")]
+    n = "all" if spec.get("n") is None else spec["n"]
+    return os.path.join(output_folder, f"{stem}_{spec['kind']}_{n}.png")
+
+
+def data_hash(spec, D):
+    """
+    hash of everything the figure is drawn from: the figure kind, n and the plotted columns
+    """
+    h = hashlib.sha256(json.dumps([spec["kind"], spec.get("n")]).encode())
+    h.update(pd.util.hash_pandas_object(D, index=False).to_numpy().tobytes())
+    return h.hexdigest()
+
+
+def _init_worker():
+    # workers never open windows
+    import matplotlib
+
+    matplotlib.use("Agg")
+
+
+def render(spec, output, previous_hash=None):
+    """
+    Draws one figure unless its data hashes to previous_hash and output exists.
+    Returns (hash, rendered).
+    """
+    D = get_diffy_expressed_genes(spec["diff_file"])[["gene_id", "log2(fold_change)"]]
+    digest = data_hash(spec, D)
+    if digest == previous_hash and os.path.exists(output):
+        return digest, False
+    FIGURES[spec["kind"]](D, spec.get("n"), output)
+    return digest, True
+
+
+def _load_manifest(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_manifest(path, manifest):
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(tmp, path)
+
+
+def render_figures(specs, output_folder="figs", processes=None):
+    """
+    Renders every spec ({"diff_file", "kind", "n"}, kind in FIGURES) in a process pool with the
+    Agg backend. The data hash of each figure is kept in output_folder/figures.json; figures
+    whose hash is unchanged are not redrawn.
+
+    Returns one {"path", "rendered"} or {"path", "error"} dict per spec.
+    """
+    os.makedirs(output_folder, exist_ok=True)
+    manifest_path = os.path.join(output_folder, MANIFEST)
+    manifest = _load_manifest(manifest_path)
+
+    paths = [figure_path(spec, output_folder) for spec in specs]
+    results = []
+    with ProcessPoolExecutor(max_workers=processes, initializer=_init_worker) as pool:
+        futures = [
+            pool.submit(render, spec, path, manifest.get(path, {}).get("hash"))
+            for spec, path in zip(specs, paths)
+        ]
+        for spec, path, future in zip(specs, paths, futures):
+            try:
+                digest, rendered = future.result()
+            except Exception as e:
+                print(f"could not render {path}: {e}")
+                results.append({"path": path, "error": repr(e)})
+                continue
+            manifest[path] = {"hash": digest, "spec": spec}
+            results.append({"path": path, "rendered": rendered})
+
+    _save_manifest(manifest_path, manifest)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="render heatmaps and FC histograms")
+    parser.add_argument(
+        "diff_files",
+        nargs="*",
+        default=[f"diff/5s_vs_4s.{t}.diff" for t in FIGURE_TYPES],
+    )
+    parser.add_argument("--kinds", nargs="+", default=list(FIGURES), choices=list(FIGURES))
+    parser.add_argument("--n", type=int, default=30)
+    parser.add_argument("--output-folder", default="figs")
+    parser.add_argument("--processes", type=int)
+    args = parser.parse_args()
+
+    specs = [
+        # histograms show the whole distribution
+        {"diff_file": diff_file, "kind": kind, "n": args.n if kind == "heatmap" else None}
+        for diff_file in args.diff_files
+        for kind in args.kinds
+    ]
+    results = render_figures(specs, args.output_folder, args.processes)
+    rendered = sum(r.get("rendered", False) for r in results)
+    print(f"{rendered} rendered, {len(results) - rendered} unchanged or failed")
@@ -0,0 +1,23 @@
+# swapping whole folders of memory-mapped files into place
+import os
+import shutil
+
+
+def replace_folder(tmp, folder):
+    """
+    Moves the freshly written folder tmp to folder. A previous folder is renamed aside and
+    deleted rather than overwritten, so processes that still have its files memory-mapped
+    keep reading the old pages.
+    """
+    old = f"{folder}.old-{os.getpid()}"
+    try:
+        os.replace(folder, old)
+    except FileNotFoundError:
+        old = None
+    try:
+        os.replace(tmp, folder)
+    except OSError:
+        # another process moved its copy in first
+        shutil.rmtree(tmp, ignore_errors=True)
+    if old is not None:
+        shutil.rmtree(old, ignore_errors=True)
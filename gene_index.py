@@ -0,0 +1,149 @@
+# memory-mapped gene identifier index for mapping gene lists before they are uploaded to ClueGO
+import json
+import os
+import re
+import shutil
+import sys
+
+import numpy as np
+import pandas as pd
+
+from folders import replace_folder
+
+# accession.version -> accession, only for ID types that carry a version (symbols may contain dots)
+_VERSIONED = re.compile(r"^((?:[NX][MRP]_|ENS[A-Z]*)\d+)\.\d+$")
+
+
+def normalize_id(gene_id):
+    gene_id = gene_id.strip().upper()
+    match = _VERSIONED.match(gene_id)
+    return match.group(1) if match else gene_id
+
+
+class GeneIdIndex:
+    """
+    Maps any known identifier of a gene (RefSeq NM_, Ensembl ENSG/ENST, symbol, ...) to one
+    canonical ID. Stored as three .npy files that are memory-mapped on load, so opening the
+    index costs nothing and every process shares the same pages:
+
+    - aliases.npy - sorted, normalized aliases (fixed width bytes)
+    - targets.npy - for each alias, the row of its canonical ID
+    - canonical.npy - the canonical IDs
+    """
+
+    def __init__(self, folder):
+        self.folder = folder
+        self.aliases = np.load(os.path.join(folder, "aliases.npy"), mmap_mode="r")
+        self.targets = np.load(os.path.join(folder, "targets.npy"), mmap_mode="r")
+        self.canonical = np.load(os.path.join(folder, "canonical.npy"), mmap_mode="r")
+        with open(os.path.join(folder, "meta.json")) as f:
+            self.meta = json.load(f)
+
+    @staticmethod
+    def build(
+        annotation_file,
+        folder,
+        canonical_column="Gene name",
+        alias_columns=None,
+        delimiter="\t",
+        separator=",",
+    ):
+        """
+        Builds an index from a table with one column per ID type, e.g. a BioMart export with
+        "Gene stable ID", "Transcript stable ID", "RefSeq mRNA ID" and "Gene name" columns.
+        Cells may hold several IDs joined by separator. An alias claimed by two canonical IDs
+        keeps the first one.
+
+        :param canonical_column (str) - ID type genes are mapped to; it is also an alias of itself
+        :param alias_columns (list) - columns to index, every column if None
+        """
+        table = pd.read_csv(annotation_file, delimiter=delimiter, dtype=str)
+        table = table.dropna(subset=[canonical_column])
+        if alias_columns is None:
+            alias_columns = list(table.columns)
+        if canonical_column not in alias_columns:
+            alias_columns = [canonical_column] + list(alias_columns)
+
+        canonical_codes, canonical = pd.factorize(table[canonical_column].str.strip())
+
+        # long table of (alias, canonical row), one row per alias occurrence
+        pairs = pd.concat(
+            [
+                pd.DataFrame({"alias": table[column], "target": canonical_codes})
+                for column in alias_columns
+            ],
+            ignore_index=True,
+        ).dropna()
+        pairs["alias"] = pairs["alias"].str.split(separator)
+        pairs = pairs.explode("alias")
+        pairs["alias"] = pairs["alias"].map(normalize_id)
+        pairs = pairs[pairs["alias"] != ""]
+
+        first = pairs.drop_duplicates("alias")
+        conflicts = pairs.drop_duplicates().duplicated("alias").sum()
+        first = first.sort_values("alias", kind="stable")
+
+        # built next to folder and moved in whole, so open indexes keep their old pages
+        tmp = f"{folder}.tmp-{os.getpid()}"
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+        try:
+            aliases = first["alias"].str.encode("utf-8").to_numpy(dtype=bytes)
+            np.save(os.path.join(tmp, "aliases.npy"), aliases)
+            np.save(os.path.join(tmp, "targets.npy"), first["target"].to_numpy(np.int32))
+            np.save(
+                os.path.join(tmp, "canonical.npy"),
+                pd.Series(canonical).str.encode("utf-8").to_numpy(dtype=bytes),
+            )
+            with open(os.path.join(tmp, "meta.json"), "w") as f:
+                json.dump(
+                    {
+                        "source": os.path.abspath(annotation_file),
+                        "canonical_column": canonical_column,
+                        "alias_columns": alias_columns,
+                        "aliases": len(aliases),
+                        "genes": len(canonical),
+                        "conflicts": int(conflicts),
+                    },
+                    f,
+                )
+        except BaseException:
+            shutil.rmtree(tmp, ignore_errors=True)
+            raise
+        replace_folder(tmp, folder)
+        return GeneIdIndex(folder)
+
+    def lookup(self, gene_ids):
+        """
+        canonical row of each gene ID, -1 if unknown
+        """
+        if len(gene_ids) == 0:
+            return np.empty(0, dtype=np.int64)
+        query = np.array([normalize_id(g).encode("utf-8") for g in gene_ids])
+        pos = np.searchsorted(self.aliases, query)
+        pos = np.minimum(pos, len(self.aliases) - 1)
+        found = self.aliases[pos] == query
+        return np.where(found, self.targets[pos], -1)
+
+    def resolve(self, gene_ids):
+        """
+        Maps gene_ids to canonical IDs, keeping the first occurrence of each gene.
+        Returns (canonical IDs, unmapped input IDs).
+        """
+        gene_ids = list(gene_ids)
+        rows = self.lookup(gene_ids)
+
+        mapped = rows[rows >= 0]
+        _, first = np.unique(mapped, return_index=True)
+        canonical = [c.decode("utf-8") for c in self.canonical[mapped[np.sort(first)]]]
+        unmapped = [g for g, row in zip(gene_ids, rows) if row < 0]
+        return canonical, unmapped
+
+
+if __name__ == "__main__":
+    # python gene_index.py <annotation file> <index folder> [canonical column]
+    if len(sys.argv) < 3:
+        print("usage: python gene_index.py <annotation file> <index folder> [canonical column]")
+        sys.exit(1)
+    index = GeneIdIndex.build(sys.argv[1], sys.argv[2], *sys.argv[3:4])
+    print(index.meta)
@@ -1,14 +1,118 @@
+import json
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sb
+
+from folders import replace_folder
 
 """
 postive log2FC implies upregulation in the treated (4s) sample
 """
 
+# compact dtypes for the cuffdiff columns we use, see load_cuffdiff
+CUFFDIFF_DTYPES = {
+    "test_id": str,
+    "gene_id": str,
+    "gene": str,
+    "status": "category",
+    "value_1": np.float32,
+    "value_2": np.float32,
+    "log2(fold_change)": np.float32,
+    "test_stat": np.float32,
+    "p_value": np.float32,
+    "q_value": np.float32,
+    "significant": "category",
+}
+
+DIFF_COLUMNS = ["gene_id", "log2(fold_change)", "p_value", "q_value", "significant"]
+
+
+def _cache_dir(filepath):
+    return filepath + ".cache"
+
+
+def _read_cache(filepath, columns):
+    """
+    Returns the cached columns as a DataFrame backed by memory-mapped .npy files,
+    or None if there is no cache or the source changed since it was written.
+    """
+    folder = _cache_dir(filepath)
+    try:
+        with open(os.path.join(folder, "meta.json")) as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    stat = os.stat(filepath)
+    if meta["mtime_ns"] != stat.st_mtime_ns or meta["size"] != stat.st_size:
+        return None
+    if not set(columns) <= set(meta["columns"]):
+        return None
+
+    data = {}
+    for name in columns:
+        col = meta["columns"][name]
+        values = np.load(os.path.join(folder, col["file"]), mmap_mode="r")
+        if "categories" in col:
+            values = pd.Categorical.from_codes(values, col["categories"])
+        data[name] = values
+    return pd.DataFrame(data, copy=False)
 
-def get_diffy_expressed_genes(filepath):
+
+def _write_cache(filepath, D):
+    folder = _cache_dir(filepath)
+    tmp = f"{folder}.tmp-{os.getpid()}"
+    stat = os.stat(filepath)
+    meta = {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size, "columns": {}}
+    try:
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+        for i, name in enumerate(D.columns):
+            col = {"file": f"col{i}.npy"}
+            values = D[name]
+            if isinstance(values.dtype, pd.CategoricalDtype):
+                col["categories"] = [str(c) for c in values.cat.categories]
+                values = values.cat.codes.to_numpy()
+            elif pd.api.types.is_string_dtype(values.dtype):
+                # fixed width unicode so the column can be memory-mapped
+                values = values.fillna("").to_numpy(dtype=str)
+            else:
+                values = values.to_numpy()
+            np.save(os.path.join(tmp, col["file"]), values)
+            meta["columns"][name] = col
+        with open(os.path.join(tmp, "meta.json"), "w") as f:
+            json.dump(meta, f)
+        # the whole cache is swapped in at once, a half written one is never read
+        replace_folder(tmp, folder)
+    except OSError as e:
+        shutil.rmtree(tmp, ignore_errors=True)
+        print(f"could not cache {filepath}: {e}")
+
+
+def load_cuffdiff(filepath, columns=DIFF_COLUMNS):
+    """
+    Reads only the given columns of a cuffdiff file with the compact dtypes in CUFFDIFF_DTYPES.
+    A binary copy is kept in <filepath>.cache/ and memory-mapped on later calls, until the
+    source file's mtime or size changes.
+    """
+    columns = list(columns)
+    D = _read_cache(filepath, columns)
+    if D is not None:
+        return D
+
+    D = pd.read_csv(
+        filepath,
+        delimiter="\t",
+        usecols=columns,
+        dtype={c: CUFFDIFF_DTYPES[c] for c in columns if c in CUFFDIFF_DTYPES},
+    )[columns]
+    _write_cache(filepath, D)
+    return D
+
+
+def get_diffy_expressed_genes(filepath, n=None):
     """
     This function computes a normalized FC score with all rows with that have non inf FC values.
     Returns a dataframe where sorted in decreasing order of absolute normalized FC.
@@ -20,68 +124,130 @@ def get_diffy_expressed_genes(filepath):
     - q_value
     Removes all rows with significance == no
 
-
-
+    With n, only the top n rows are selected (partial selection, no full sort), see topk.py.
     """
-    D = pd.read_csv(filepath, delimiter="\t")
-    # remove all rows whose log2FC is inf
-    D = D.replace([float("inf"), float("-inf")], pd.NA).dropna(
-        subset=["log2(fold_change)"]
-    )
+    D = load_cuffdiff(filepath)
+    # remove all rows whose log2FC is inf (or missing) and all non significant rows
+    D = D[np.isfinite(D["log2(fold_change)"]) & (D["significant"] == "yes")]
     # D["z_norm_log2FC"] = (D["log2(fold_change)"] - D["log2(fold_change)"].mean()) / D[
     #     "log2(fold_change)"
     # ].std()
-    D = D[D["significant"] == "yes"]
 
     D = D[["gene_id", "log2(fold_change)", "p_value", "q_value"]]
 
-    D.sort_values(
-        by="log2(fold_change)", inplace=True, key=lambda x: abs(x), ascending=False
-    )
-    D["log2(fold_change)"] = pd.to_numeric(D["log2(fold_change)"], errors="coerce")
+    if n is not None:
+        from topk import top_k
+
+        return top_k(D, n)
+
+    D = D.sort_values(by="log2(fold_change)", key=lambda x: abs(x), ascending=False)
 
     return D
 
 
-def make_heatmaps(D, n):
+def make_heatmaps(D, n, output="figs/heatmaps.png"):
+    import matplotlib.pyplot as plt
+    import seaborn as sb
+
     n = min(n, 30)
 
-    D_abs = D.sort_values("log2(fold_change)", key=lambda x: abs(x), ascending=False)
-    sb.heatmap(
-        D_abs[["log2(fold_change)"]].head(n).sort_values("log2(fold_change)", ascending=False),
-        yticklabels=D["gene_id"].head(n),
-        cmap="Greens",
+    top = (
+        D.sort_values("log2(fold_change)", key=lambda x: abs(x), ascending=False)
+        .head(n)
+        .sort_values("log2(fold_change)", ascending=False)
     )
-    plt.title(f"Top {n} differentially regulated genes")
-    plt.savefig("figs/heatmaps.png")
-    plt.close()
-
+    fig, ax = plt.subplots()
+    try:
+        sb.heatmap(
+            top[["log2(fold_change)"]],
+            yticklabels=top["gene_id"],
+            cmap="Greens",
+            ax=ax,
+        )
+        ax.set_title(f"Top {n} differentially regulated genes")
+        fig.savefig(output)
+    finally:
+        plt.close(fig)
 
-def make_histogram(D):
 
-    plt.hist(D["log2(fold_change)"], bins=100)
-    plt.title("Distrubution of Z-normalized Log2FC values")
-    plt.savefig("figs/distribution of FC")
+def make_histogram(D, output="figs/distribution of FC"):
+    import matplotlib.pyplot as plt
 
+    fig, ax = plt.subplots()
+    try:
+        ax.hist(D["log2(fold_change)"], bins=100)
+        ax.set_title("Distrubution of Z-normalized Log2FC values")
+        fig.savefig(output)
+    finally:
+        plt.close(fig)
 
 import pandas as pd
 
 
-def count_significant_rows():
-    files = [
-        "diff/5s_vs_4s.cds.diff",
-        "diff/5s_vs_4s.gene_exp.diff",
-        "diff/5s_vs_4s.promoters.diff",
-        "diff/5s_vs_4s.cds_exp.diff",
-        "diff/5s_vs_4s.isoform_exp.diff",
-        "diff/5s_vs_4s.splicing.diff",
-    ]
-    for fname in files:
-        D = pd.read_csv(fname, delimiter="\t")
-        name = fname.split(".")[1]
-        total_row = D.shape[0]
-        sig_rows = D[D["significant"] == "yes"].shape[0]
-        print(f"{name} : {100*sig_rows/total_row}")
+CUFFDIFF_OUTPUTS = [
+    "diff/5s_vs_4s.cds.diff",
+    "diff/5s_vs_4s.gene_exp.diff",
+    "diff/5s_vs_4s.promoters.diff",
+    "diff/5s_vs_4s.cds_exp.diff",
+    "diff/5s_vs_4s.isoform_exp.diff",
+    "diff/5s_vs_4s.splicing.diff",
+]
+
+
+def summarize_cuffdiff(filepath, chunksize=100_000):
+    """
+    Streams a cuffdiff file in chunks of chunksize rows, so memory does not grow with the file.
+    Returns the row count, number and fraction of significant rows, inf/NaN log2(fold_change)
+    counts (cds, promoters and splicing files have no fold change column) and a count per status.
+    """
+    header = pd.read_csv(filepath, delimiter="\t", nrows=0).columns
+    columns = [c for c in ["status", "significant", "log2(fold_change)"] if c in header]
+
+    rows = significant = inf_fc = nan_fc = 0
+    status = {}
+    chunks = pd.read_csv(
+        filepath,
+        delimiter="\t",
+        usecols=columns,
+        dtype={c: CUFFDIFF_DTYPES[c] for c in columns},
+        chunksize=chunksize,
+    )
+    for chunk in chunks:
+        rows += len(chunk)
+        significant += int((chunk["significant"] == "yes").sum())
+        if "log2(fold_change)" in chunk:
+            fc = chunk["log2(fold_change)"].to_numpy()
+            inf_fc += int(np.isinf(fc).sum())
+            nan_fc += int(np.isnan(fc).sum())
+        for name, count in chunk["status"].value_counts().items():
+            status[name] = status.get(name, 0) + int(count)
+
+    return {
+        "file": filepath,
+        "name": os.path.basename(filepath).split(".")[1],
+        "rows": rows,
+        "significant": significant,
+        "significant_fraction": significant / rows if rows else 0.0,
+        "inf_fc": inf_fc,
+        "nan_fc": nan_fc,
+        "status": status,
+    }
+
+
+def count_significant_rows(files=CUFFDIFF_OUTPUTS, processes=None):
+    """
+    Summarizes every file in parallel, one process per file (up to processes).
+    """
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        summaries = list(pool.map(summarize_cuffdiff, files))
+
+    for summary in summaries:
+        print(
+            f"{summary['name']} : {100*summary['significant_fraction']}"
+            f"\tinf FC: {summary['inf_fc']}\tNaN FC: {summary['nan_fc']}"
+            f"\t{summary['status']}"
+        )
+    return summaries
 
 
 def main():
@@ -0,0 +1,153 @@
+# on-disk cache of g:Profiler enrichment results, with batched lookups of the misses
+#   python gprofiler_cache.py stats [cache folder]
+import os
+import sys
+from pathlib import Path
+
+import pandas as pd
+
+from result_cache import LRUCache, inputs_key
+
+
+def query_key(genes, organism, options):
+    """
+    Gene order does not matter to g:Profiler unless the query is ordered, so unordered queries
+    are keyed by their sorted, deduplicated genes.
+    """
+    genes = list(genes) if options.get("ordered") else sorted(set(genes))
+    return inputs_key({"organism": organism, "query": genes, "options": options})
+
+
+class GProfilerCache(LRUCache):
+    """
+    Stores every g:Profiler result as root/<key>.json, where key is the hash of the organism,
+    the query and the options (see query_key). When the cache grows past max_bytes the least
+    recently used results are evicted.
+
+    With offline=True nothing is sent to g:Profiler and a lookup that is not cached raises
+    RuntimeError; GPROFILER_OFFLINE=1 in the environment sets it by default.
+    """
+
+    def __init__(
+        self,
+        root=str(Path.home()) + "/GProfilerCache",
+        max_bytes=256 * 1024**2,
+        offline=None,
+    ):
+        super().__init__(root, max_bytes)
+        if offline is None:
+            offline = os.environ.get("GPROFILER_OFFLINE") == "1"
+        self.offline = offline
+        self._gp = None
+
+    def _remove_files(self, key):
+        try:
+            os.remove(self.__path(key))
+        except OSError:
+            pass
+
+    def __path(self, key):
+        return os.path.join(self.root, key + ".json")
+
+    def __read(self, key):
+        try:
+            return pd.read_json(self.__path(key), orient="table")
+        except (OSError, ValueError):
+            return None
+
+    def __write(self, key, result, organism, genes, options):
+        path = self.__path(key)
+        tmp = path + ".tmp"
+        result.reset_index(drop=True).to_json(tmp, orient="table", index=False)
+        os.replace(tmp, path)
+        self._add(
+            key,
+            {
+                "bytes": os.path.getsize(path),
+                "organism": organism,
+                "genes": len(genes),
+                "options": options,
+            },
+        )
+
+    def __query(self, queries, organism, options):
+        """
+        one g:Profiler request for every gene list in queries, split back per list
+        """
+        if self._gp is None:
+            from gprofiler import GProfiler
+
+            self._gp = GProfiler(return_dataframe=True)
+
+        response = self._gp.profile(organism=organism, query=queries, **options)
+        if len(queries) == 1 and "query" in response:
+            # a single query comes back named "query_1"
+            response["query"] = next(iter(queries))
+        results = {}
+        for name in queries:
+            if "query" in response:
+                rows = response[response["query"] == name]
+                results[name] = rows.drop(columns="query").reset_index(drop=True)
+            else:
+                results[name] = response.iloc[0:0]
+        return results
+
+    def profile_many(self, queries, organism="hsapiens", **options):
+        """
+        Profiles several gene lists ({name: genes}) with the same organism and options, e.g. one
+        list per contrast or per n. Cached lists are served from disk; the rest are sent in a
+        single g:Profiler request. Returns {name: DataFrame}.
+        """
+        results = {}
+        misses = {}
+        with self._lock:
+            self._load_index()
+            for name, genes in queries.items():
+                key = query_key(genes, organism, options)
+                entry = self.index["entries"].get(key)
+                result = self.__read(key) if entry is not None else None
+                if result is None:
+                    self._miss()
+                    misses[name] = (key, list(genes))
+                    continue
+                self._hit(key)
+                results[name] = result
+            self._save_index()
+
+        if not misses:
+            return results
+        if self.offline:
+            raise RuntimeError(
+                f"g:Profiler results for {sorted(misses)} are not cached and the cache is offline"
+            )
+
+        fetched = self.__query(
+            {name: genes for name, (_, genes) in misses.items()}, organism, options
+        )
+        with self._lock:
+            self._load_index()
+            for name, (key, genes) in misses.items():
+                self.__write(key, fetched[name], organism, genes, options)
+                results[name] = fetched[name]
+            self._evict()
+            self._save_index()
+        return {name: results[name] for name in queries}
+
+    def profile(self, genes, organism="hsapiens", **options):
+        """
+        cached GProfiler(return_dataframe=True).profile(organism=organism, query=genes, **options)
+        """
+        return self.profile_many({"query": genes}, organism, **options)["query"]
+
+    def stats(self):
+        return dict(super().stats(), offline=self.offline)
+
+
+if __name__ == "__main__":
+    # python gprofiler_cache.py stats [cache folder]
+    if len(sys.argv) < 2 or sys.argv[1] != "stats":
+        print("usage: python gprofiler_cache.py stats [cache folder]")
+        sys.exit(1)
+    cache = GProfilerCache(*sys.argv[2:3])
+    for name, value in cache.stats().items():
+        print(f"{name}\t{value}")
@@ -1,34 +1,33 @@
-import numpy as np
-import pandas as pd
-import sys
 import matplotlib.pyplot as plt
 import seaborn as sns
-from gprofiler import GProfiler
+from gprofiler_cache import GProfilerCache
+from topk import Z_COLUMN, stream_top_k
 
 def top_n_differentially_regulated_genes(filepath, n = 30):
     """
     - Determines the top n differentially expressed genes from cufflinks output. 
     - filepath must specify a file of with the format described here https://cole-trapnell-lab.github.io/cufflinks/cuffdiff/#fpkm-tracking-format
+    - Streams the file, so memory stays O(n) whatever its size (see topk.stream_top_k).
     """
 
-    D = pd.read_csv(filepath_or_buffer= filepath, delimiter="\t", header = 0)
-
-    D = D[D["significant"] == "yes"].copy() #check that this matters
-    D["log2(fold_change)"] = np.log2(D["value_1"] / D["value_2"]) # We want genes that are upregulated in treatment to have a positive FC
+    # z-normalized log2(value_1 / value_2) of the significant genes, non finite ratios are skipped
+    D = stream_top_k(filepath, n, key="z")
+    # We want genes that are upregulated in treatment to have a positive FC
     D["FC"] = D["value_1"] / D["value_2"]
-    D["log2(fold_change)"] = (D["log2(fold_change)"] - D["log2(fold_change)"].mean() ) / D["log2(fold_change)"].std()    
+    D["log2(fold_change)"] = D.pop(Z_COLUMN)
 
-    D = D.sort_values(by = "log2(fold_change)",key = lambda fc: abs(fc), ascending= False)
-    D = D.head(n).sort_values("log2(fold_change)",ascending=False)
+    D = D.sort_values("log2(fold_change)",ascending=False)
 
     return D
     
-def invoke_g_profiler(D):
+def invoke_g_profiler(D, cache=None):
     """
-    calls g_profiler on a data frame of genes
+    calls g_profiler on a data frame of genes, answering from the on-disk cache when the same
+    gene list was profiled before (see gprofiler_cache.py)
     """
-    gp = GProfiler(return_dataframe=True)
-    response = gp.profile(organism="hsapiens", query= list(D["gene_id"]),no_evidences=False)
+    if cache is None:
+        cache = GProfilerCache()
+    response = cache.profile(list(D["gene_id"]), organism="hsapiens", no_evidences=False)
     return response
 
 
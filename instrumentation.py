@@ -0,0 +1,143 @@
+# per-endpoint latency and payload statistics for the calls made through a Transport
+import csv
+import json
+import threading
+import time
+from collections import deque
+
+# upper bounds (seconds) of the latency histogram buckets
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+
+
+class Instrumentation:
+    """
+    Collects one span per cyREST/ClueGO call: method, endpoint template, wall time, request and
+    response bytes, status and retries. Spans are aggregated per endpoint into a latency
+    histogram; the last keep_spans raw spans are kept as well.
+
+    Attach it with Transport(instrumentation=Instrumentation()). A Transport without one does no
+    timing or bookkeeping at all.
+    """
+
+    def __init__(self, keep_spans=10000):
+        self.spans = deque(maxlen=keep_spans)
+        self.endpoints = {}
+        self.hooks = []
+        self._lock = threading.Lock()
+
+    def add_hook(self, hook):
+        """
+        hook(span) is called for every span, e.g. to forward it to another metrics system.
+        It runs on the thread that made the call, so it should be quick. A hook that raises
+        is reported and skipped; it never fails the call being recorded.
+        """
+        self.hooks.append(hook)
+
+    def record(self, span):
+        with self._lock:
+            self.spans.append(span)
+            key = (span["method"], span["endpoint"])
+            stats = self.endpoints.get(key)
+            if stats is None:
+                stats = self.endpoints[key] = {
+                    "method": span["method"],
+                    "endpoint": span["endpoint"],
+                    "calls": 0,
+                    "errors": 0,
+                    "retries": 0,
+                    "seconds": 0.0,
+                    "max_seconds": 0.0,
+                    "request_bytes": 0,
+                    "response_bytes": 0,
+                    "histogram": [0] * (len(BUCKETS) + 1),
+                }
+            stats["calls"] += 1
+            stats["retries"] += span["retries"]
+            stats["seconds"] += span["seconds"]
+            stats["max_seconds"] = max(stats["max_seconds"], span["seconds"])
+            stats["request_bytes"] += span["request_bytes"]
+            stats["response_bytes"] += span["response_bytes"]
+            if span["error"] is not None or not str(span["status"]).startswith("2"):
+                stats["errors"] += 1
+            bucket = next(
+                (i for i, bound in enumerate(BUCKETS) if span["seconds"] <= bound),
+                len(BUCKETS),
+            )
+            stats["histogram"][bucket] += 1
+
+        for hook in self.hooks:
+            try:
+                hook(span)
+            except Exception as e:
+                print(f"instrumentation\thook {hook!r} failed\t{e!r}")
+
+    def span(
+        self,
+        method,
+        endpoint,
+        start,
+        request_bytes,
+        response=None,
+        error=None,
+        stream=False,
+    ):
+        """
+        builds and records the span of a call that started at time.perf_counter() == start.
+        A stream's span is recorded once its body was read (see Transport.request), so
+        response_bytes is what was actually read off the connection.
+        """
+        status = response_bytes = None
+        retries = 0
+        if response is not None:
+            status = response.status_code
+            if response.raw is not None and getattr(response.raw, "retries", None):
+                retries = len(response.raw.retries.history)
+            if stream:
+                response_bytes = getattr(response.raw, "tell", lambda: 0)()
+            else:
+                response_bytes = len(response.content)
+        self.record(
+            {
+                "time": time.time(),
+                "method": method,
+                "endpoint": endpoint,
+                "seconds": time.perf_counter() - start,
+                "request_bytes": request_bytes,
+                "response_bytes": response_bytes or 0,
+                "status": status,
+                "retries": retries,
+                "error": None if error is None else repr(error),
+            }
+        )
+
+    def summary(self):
+        """
+        one dict per (method, endpoint), slowest total time first
+        """
+        with self._lock:
+            rows = [dict(stats) for stats in self.endpoints.values()]
+        for row in rows:
+            row["histogram"] = list(row["histogram"])
+            row["mean_seconds"] = row["seconds"] / row["calls"]
+        return sorted(rows, key=lambda row: row["seconds"], reverse=True)
+
+    def to_json(self, path):
+        with open(path, "w") as f:
+            json.dump(
+                {"buckets": list(BUCKETS), "endpoints": self.summary()}, f, indent=1
+            )
+
+    def to_csv(self, path):
+        rows = self.summary()
+        bucket_names = [f"le_{bound}" for bound in BUCKETS] + ["le_inf"]
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f)
+            header = [k for k in rows[0] if k != "histogram"] if rows else []
+            writer.writerow(header + bucket_names)
+            for row in rows:
+                writer.writerow([row[k] for k in header] + row["histogram"])
+
+    def reset(self):
+        with self._lock:
+            self.spans.clear()
+            self.endpoints.clear()
@@ -0,0 +1,150 @@
+# local kappa scores between terms and ClueGO style term grouping
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from scipy.sparse.csgraph import connected_components
+
+
+class KappaMatrix:
+    """
+    Pairwise kappa scores between the terms of a GeneTermMatrix, keeping only pairs with
+    kappa >= min_kappa.
+
+    Two terms with no gene in common always have kappa <= 0, so for min_kappa > 0 every kept pair
+    is a non-zero of the sparse product A @ A.T; the dense term x term matrix is never built.
+    Edges are kept sorted by kappa so any cutoff above min_kappa is a slice, see edges().
+
+    :param universe_size (int) - number of genes kappa is computed over, all annotated genes if None
+    """
+
+    def __init__(self, annotation, min_kappa=0.3, universe_size=None):
+        if min_kappa <= 0:
+            raise ValueError("min_kappa must be > 0 to keep the kappa matrix sparse")
+        self.annotation = annotation
+        self.min_kappa = min_kappa
+
+        A = annotation.matrix
+        G = float(universe_size or A.shape[1])
+        size = annotation.term_sizes.astype(np.float64)
+
+        # genes shared by each pair of terms, upper triangle only
+        shared = sparse.triu(A @ A.T, k=1).tocoo()
+        i, j, both = shared.row, shared.col, shared.data.astype(np.float64)
+        ni, nj = size[i], size[j]
+
+        observed = (G - ni - nj + 2 * both) / G
+        expected = (ni * nj + (G - ni) * (G - nj)) / G**2
+        with np.errstate(divide="ignore", invalid="ignore"):
+            kappa = (observed - expected) / (1 - expected)
+
+        keep = np.isfinite(kappa) & (kappa >= min_kappa)
+        order = np.argsort(-kappa[keep], kind="stable")
+        self.rows = i[keep][order]
+        self.cols = j[keep][order]
+        self.kappa = kappa[keep][order]
+
+    def edges(self, cutoff):
+        """
+        (rows, cols, kappa) of every term pair with kappa >= cutoff
+        """
+        if cutoff < self.min_kappa:
+            raise ValueError(f"cutoff is below min_kappa={self.min_kappa}")
+        # self.kappa is sorted in decreasing order
+        end = np.searchsorted(-self.kappa, -cutoff, side="right")
+        return self.rows[:end], self.cols[:end], self.kappa[:end]
+
+    def to_sparse(self, cutoff):
+        """
+        symmetric term x term CSR matrix of the kappa scores >= cutoff
+        """
+        rows, cols, kappa = self.edges(cutoff)
+        n = self.annotation.shape[0]
+        upper = sparse.csr_matrix((kappa, (rows, cols)), shape=(n, n))
+        return (upper + upper.T).tocsr()
+
+
+def group_terms(
+    kappa_matrix,
+    cutoff=0.4,
+    init_group_size=1,
+    perc_groups_for_merge=50,
+    perc_terms_for_merge=50,
+    pvalues=None,
+):
+    """
+    Groups terms the way ClueGO's "Kappa Score" grouping does, with the parameters of
+    ClueGoClient.set_grouping:
+
+    - every term with at least init_group_size - 1 neighbours (kappa >= cutoff) seeds a group
+      made of itself and its neighbours
+    - two groups are merged when their shared terms make up at least perc_terms_for_merge % of
+      the smaller group and perc_groups_for_merge % of the larger one; merging repeats until stable
+
+    Terms that end up in no group are left out. The leading term of a group is the one with the
+    lowest p value if pvalues (one per term) is given, otherwise the one with the most genes.
+
+    :returns (pd.DataFrame) - columns group, term, leading_term; a term can be in several groups
+    """
+    annotation = kappa_matrix.annotation
+    n_terms = annotation.shape[0]
+
+    adjacency = kappa_matrix.to_sparse(cutoff)
+    adjacency.data[:] = 1
+    degree = adjacency.getnnz(axis=1)
+
+    # groups x terms membership; row g is seed g plus its neighbours
+    seeds = np.flatnonzero(degree >= init_group_size - 1)
+    membership = (adjacency[seeds] + sparse.eye(n_terms, format="csr")[seeds]).tocsr()
+    membership.data[:] = 1
+
+    while membership.shape[0] > 1:
+        membership = _unique_rows(membership)
+        size = membership.getnnz(axis=1).astype(np.float64)
+        shared = sparse.triu(membership @ membership.T, k=1).tocoo()
+        small = np.minimum(size[shared.row], size[shared.col])
+        large = np.maximum(size[shared.row], size[shared.col])
+        merge = (100 * shared.data >= perc_terms_for_merge * small) & (
+            100 * shared.data >= perc_groups_for_merge * large
+        )
+        if not merge.any():
+            break
+
+        # groups connected by a merge collapse into one: union of their rows
+        pairs = sparse.csr_matrix(
+            (np.ones(merge.sum()), (shared.row[merge], shared.col[merge])),
+            shape=(membership.shape[0],) * 2,
+        )
+        _, labels = connected_components(pairs, directed=False)
+        collapse = sparse.csr_matrix(
+            (np.ones(len(labels)), (labels, np.arange(len(labels)))),
+            shape=(labels.max() + 1, len(labels)),
+        )
+        membership = (collapse @ membership).tocsr()
+        membership.data[:] = 1
+
+    groups, terms = membership.nonzero()
+    result = pd.DataFrame({"group": groups, "term": annotation.terms[terms]})
+
+    if pvalues is not None:
+        score = -np.asarray(pvalues, dtype=np.float64)[terms]
+    else:
+        score = annotation.term_sizes[terms].astype(np.float64)
+    # position (within result) of the best scoring term of each group
+    leading = pd.Series(score).groupby(groups).idxmax()
+    result["leading_term"] = result["group"].map(
+        pd.Series(result["term"].to_numpy()[leading.to_numpy()], index=leading.index)
+    )
+    return result.sort_values(["group", "term"], ignore_index=True)
+
+
+def _unique_rows(matrix):
+    """
+    drops duplicate rows of a binary CSR matrix
+    """
+    matrix.sort_indices()
+    keys = [
+        matrix.indices[matrix.indptr[r] : matrix.indptr[r + 1]].tobytes()
+        for r in range(matrix.shape[0])
+    ]
+    _, first = np.unique(keys, return_index=True)
+    return matrix[np.sort(first)]
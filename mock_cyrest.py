@@ -0,0 +1,225 @@
+# local stand-in for the cyREST / ClueGO endpoints used by ClueGoClient, for benchmarks
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote, urlparse
+
+# seconds each kind of request takes before the mock answers
+DEFAULT_LATENCIES = {
+    "ping": 0.001,
+    "config": 0.002,
+    "upload": 0.005,
+    "analysis": 0.05,
+    "export": 0.005,
+    "remove": 0.002,
+}
+
+# bytes returned by each result download, roughly what a medium ClueGO network produces
+DEFAULT_PAYLOADS = {
+    "network": 400_000,
+    "get-cluego-table": 150_000,
+    "get-main-functions": 40_000,
+    "get-gene-table": 80_000,
+    "get-kappascore-matrix": 2_000_000,
+    "get-binary-gene-term-matrix": 1_000_000,
+    "get-cluego-result-chart": 60_000,
+}
+
+CLUEGO = "/v1/apps/cluego/cluego-manager"
+CHUNK = 1 << 16
+
+
+class MockState:
+    def __init__(self, latencies, payloads):
+        self.latencies = dict(DEFAULT_LATENCIES, **(latencies or {}))
+        self.payloads = dict(DEFAULT_PAYLOADS, **(payloads or {}))
+        self.lock = threading.Lock()
+        self.settings = {}
+        self.networks = []
+        self.next_suid = 1000
+        self.requests = 0
+        self.received_bytes = 0
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # headers and body go out in separate writes; with Nagle on, every keep-alive response
+    # would wait out the client's delayed ACK (~40 ms)
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    @property
+    def state(self):
+        return self.server.state
+
+    def _body(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length) if length else b""
+        with self.state.lock:
+            self.state.requests += 1
+            self.state.received_bytes += len(body)
+        return body
+
+    def _wait(self, kind):
+        time.sleep(self.state.latencies[kind])
+
+    def _send(self, status, body, content_type="application/json"):
+        if not isinstance(body, bytes):
+            body = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_payload(self, size, content_type):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(size))
+        self.end_headers()
+        line = b"GO:0000000\tterm\t0.001\t[GENE1, GENE2, GENE3]\n"
+        block = (line * (CHUNK // len(line) + 1))[:CHUNK]
+        while size > 0:
+            self.wfile.write(block[:size])
+            size -= CHUNK
+
+    def do_GET(self):
+        self._body()
+        path = urlparse(self.path).path.rstrip("/")
+        parts = [unquote(p) for p in path.split("/")]
+
+        if path in ("/v1", "/v1/version"):
+            self._wait("ping")
+            return self._send(
+                200, {"apiVersion": "v1", "cytoscapeVersion": "3.10.4 (mock)"}
+            )
+
+        if path == "/v1/networks/currentNetwork":
+            with self.state.lock:
+                suid = self.state.networks[-1] if self.state.networks else None
+            return self._send(200, {"data": {"networkSUID": suid}, "errors": []})
+
+        if path.startswith("/v1/networks/") and path.endswith("/views/first.svg"):
+            self._wait("export")
+            return self._send_payload(self.state.payloads["network"], "image/svg+xml")
+
+        if path.startswith(CLUEGO + "/analysis-results/"):
+            self._wait("export")
+            kind = parts[6]
+            content_type = "image/svg+xml" if kind.endswith("chart") else "text/plain"
+            return self._send_payload(self.state.payloads[kind], content_type)
+
+        if path.startswith(CLUEGO + "/organisms/"):
+            self._wait("config")
+            return self._send(200, ["Homo Sapiens", "Mus Musculus"])
+
+        if path.startswith(CLUEGO + "/"):
+            # {analysis name}/{analysis option}, or another read-only getter
+            self._wait("analysis" if len(parts) == 7 else "config")
+            if len(parts) == 7:
+                with self.state.lock:
+                    self.state.next_suid += 1
+                    self.state.networks.append(self.state.next_suid)
+                return self._send(200, b"analysis done\n", "text/plain")
+            return self._send(200, {})
+
+        self._send(404, {"message": f"mock has no GET {path}"})
+
+    def do_PUT(self):
+        body = self._body()
+        path = urlparse(self.path).path
+        if not path.startswith(CLUEGO + "/"):
+            return self._send(404, {"message": f"mock has no PUT {path}"})
+        self._wait("upload" if "upload-ids-list" in path else "config")
+        with self.state.lock:
+            self.state.settings[path] = body
+        self._send(200, {"message": "ok"})
+
+    def do_POST(self):
+        self._body()
+        path = unquote(urlparse(self.path).path)
+        if path == "/v1/commands/apps/list installed":
+            self._wait("ping")
+            apps = [
+                {"appName": "ClueGO", "version": "2.5.10", "status": "Installed"},
+                {"appName": "CluePedia", "version": "1.5.10", "status": "Installed"},
+            ]
+            return self._send(200, {"data": apps, "errors": []})
+        if path == "/v1/apps/cluego/start-up-cluego":
+            return self._send(200, {"message": "ok"})
+        self._send(404, {"message": f"mock has no POST {path}"})
+
+    def do_DELETE(self):
+        self._body()
+        parts = urlparse(self.path).path.rstrip("/").split("/")
+        self._wait("remove")
+        with self.state.lock:
+            if "remove-all-cluego-analysis-results" in parts:
+                self.state.networks.clear()
+            elif parts[-1].isdigit() and int(parts[-1]) in self.state.networks:
+                self.state.networks.remove(int(parts[-1]))
+        self._send(200, {"message": "ok"})
+
+
+class MockCyREST:
+    """
+    Serves the ClueGO endpoints ClueGoClient and ClueGoExample.py use, on a background thread.
+
+        with MockCyREST(latencies={"analysis": 1.0}) as mock:
+            client = ClueGoClient(host_address=mock.host, port_number=mock.port)
+
+    :param latencies (dict) - overrides of DEFAULT_LATENCIES
+    :param payloads (dict) - overrides of DEFAULT_PAYLOADS
+    :param port (int) - 0 picks a free port
+    """
+
+    def __init__(self, latencies=None, payloads=None, host="127.0.0.1", port=0):
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.server.state = MockState(latencies, payloads)
+        self.host, self.port = self.server.server_address[:2]
+        self._thread = None
+
+    @property
+    def state(self):
+        return self.server.state
+
+    @property
+    def base_url(self):
+        return f"http://{self.host}:{self.port}/v1"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="mock cyREST/ClueGO server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=1234)
+    parser.add_argument("--analysis-latency", type=float, default=1.0)
+    args = parser.parse_args()
+
+    mock = MockCyREST(
+        latencies={"analysis": args.analysis_latency}, host=args.host, port=args.port
+    )
+    print(f"mock cyREST listening on {mock.base_url}")
+    try:
+        mock.server.serve_forever()
+    except KeyboardInterrupt:
+        mock.server.server_close()
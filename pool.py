@@ -0,0 +1,159 @@
+# fan ClueGO jobs out over several Cytoscape instances
+import queue
+import threading
+import time
+
+import requests
+
+from ClueGoClient import ClueGoClient
+
+
+def parse_endpoint(endpoint):
+    """
+    "host.docker.internal:1235" -> ("host.docker.internal", "1235"); the port defaults to 1234
+    """
+    host, _, port = endpoint.partition(":")
+    return host, port or "1234"
+
+
+class ClueGoPool:
+    """
+    One worker thread (and one ClueGoClient) per Cytoscape endpoint. Workers pull jobs from a
+    shared queue, so whichever instance is idle takes the next job.
+
+    ClueGO settings are global to a Cytoscape instance, so job_fn must apply the job's full
+    configuration on the client it is given. setup(client) runs once per worker for settings
+    shared by every job (organism, ontologies, ...).
+
+    If an endpoint stops answering, its worker is dropped and the job goes back on the queue
+    for another endpoint, up to max_attempts times.
+    """
+
+    def __init__(self, endpoints, name="CLUEGO pool", setup=None, max_attempts=3):
+        self.endpoints = list(endpoints)
+        self.name = name
+        self.setup = setup
+        self.max_attempts = max_attempts
+
+        self.failed = []
+        self.dropped = []
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._remaining = 0
+
+    def __connect(self, endpoint):
+        host, port = parse_endpoint(endpoint)
+        client = ClueGoClient(
+            f"{self.name} {host} {port}", host_address=host, port_number=port
+        )
+        try:
+            client.ensure_online()
+        except requests.ConnectionError:
+            return None
+        if self.setup is not None:
+            self.setup(client)
+        return client
+
+    def __finish(self, job, error=None):
+        with self._lock:
+            self._remaining -= 1
+            if error is not None:
+                self.failed.append((job, error))
+
+    def __drop(self, endpoint, error):
+        print(f"pool\tdropping {endpoint}\t{error}")
+        with self._lock:
+            self.dropped.append((endpoint, error))
+
+    def __worker(self, endpoint, job_fn, on_result):
+        try:
+            client = self.__connect(endpoint)
+        except (requests.ConnectionError, requests.Timeout):
+            client = None
+        if client is None:
+            self.__drop(endpoint, "handshake failed")
+            return
+
+        while True:
+            try:
+                job, attempts = self._queue.get(timeout=0.1)
+            except queue.Empty:
+                with self._lock:
+                    if self._remaining == 0:
+                        return
+                continue
+
+            try:
+                result = job_fn(client, job)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                # the endpoint is gone, let another worker have the job
+                if attempts + 1 < self.max_attempts:
+                    self._queue.put((job, attempts + 1))
+                else:
+                    self.__finish(job, e)
+                self.__drop(endpoint, e)
+                return
+            except Exception as e:
+                print(f"pool\t{endpoint}\tjob failed\t{e}")
+                self.__finish(job, e)
+                continue
+
+            try:
+                if on_result is not None:
+                    on_result(job, result)
+            except Exception as e:
+                # e.g. the checkpoint could not be written; the job still has to be finished
+                # or run() would wait for it forever
+                print(f"pool\t{endpoint}\ton_result failed\t{e}")
+                self.__finish(job, e)
+                continue
+            self.__finish(job)
+
+    def run(self, jobs, job_fn, on_result=None):
+        """
+        Runs job_fn(client, job) for every job; on_result(job, result) is called as each one completes.
+        Returns the (job, error) pairs that could not be completed.
+        """
+        jobs = list(jobs)
+        self.failed = []
+        self._remaining = len(jobs)
+        for job in jobs:
+            self._queue.put((job, 0))
+
+        workers = [
+            threading.Thread(
+                target=self.__worker,
+                args=(endpoint, job_fn, on_result),
+                daemon=True,
+            )
+            for endpoint in self.endpoints
+        ]
+        for worker in workers:
+            worker.start()
+
+        while any(worker.is_alive() for worker in workers):
+            for worker in workers:
+                worker.join(timeout=0.1)
+
+        # every endpoint was dropped before the queue drained
+        while not self._queue.empty():
+            job, _ = self._queue.get()
+            self.__finish(job, RuntimeError("no live Cytoscape endpoints left"))
+
+        return self.failed
+
+    def run_sweep(self, runner):
+        """
+        Runs the pending jobs of a sweep.SweepRunner across the pool, checkpointing as they complete.
+        """
+        start = time.perf_counter()
+        done = [0]
+
+        def on_result(job, result):
+            runner.record(job, result)
+            with self._lock:
+                done[0] += 1
+                count = done[0]
+            runner.report(count, start)
+
+        return self.run(runner.pending_jobs(), runner.run_job, on_result)
@@ -0,0 +1,284 @@
+# content-addressed on-disk cache of exported ClueGO results
+import hashlib
+import json
+import os
+import shutil
+import sys
+import threading
+import time
+from abc import ABC, abstractmethod
+from pathlib import Path
+
+from ClueGoClient import EXPORT_FORMATS
+
+
+def inputs_key(inputs):
+    """
+    sha256 of the canonical JSON form of an analysis' inputs, see ClueGoClient.analysis_inputs
+    """
+    canonical = json.dumps(inputs, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+class LRUCache(ABC):
+    """
+    Bookkeeping shared by the on-disk caches: root/index.json holds one entry per key (at least
+    its "bytes" and "last_access") and the hit, miss and eviction counters. Once the entries add
+    up to more than max_bytes the least recently used ones are evicted. Subclasses store the
+    data and delete it in _remove_files(key).
+
+    Several instances may share a root, e.g. an online and an offline GProfilerCache: the
+    index is re-read under a lock shared by every instance on the root (_load_index) before
+    each change is saved, so none of them overwrites the others' entries or counters. Between
+    processes the lock does not hold; they only race in the short window between re-reading
+    and replacing index.json.
+    """
+
+    # root -> lock shared by every instance on it, like ClueGoClient._handshake_locks
+    _root_locks = {}
+    _root_locks_lock = threading.Lock()
+
+    def __init__(self, root, max_bytes):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.index_path = os.path.join(root, "index.json")
+        os.makedirs(root, exist_ok=True)
+
+        with LRUCache._root_locks_lock:
+            self._lock = LRUCache._root_locks.setdefault(
+                os.path.realpath(root), threading.Lock()
+            )
+        with self._lock:
+            self._load_index()
+
+    @abstractmethod
+    def _remove_files(self, key):
+        """
+        deletes the stored data of key
+        """
+
+    def _load_index(self):
+        self.index = {"entries": {}, "hits": 0, "misses": 0, "evictions": 0}
+        if os.path.exists(self.index_path):
+            with open(self.index_path) as f:
+                self.index = json.load(f)
+
+    def _save_index(self):
+        tmp = f"{self.index_path}.tmp-{os.getpid()}"
+        with open(tmp, "w") as f:
+            json.dump(self.index, f)
+        os.replace(tmp, self.index_path)
+
+    def _hit(self, key):
+        self.index["hits"] += 1
+        self.index["entries"][key]["last_access"] = time.time()
+
+    def _miss(self):
+        self.index["misses"] += 1
+
+    def _add(self, key, entry):
+        entry["created"] = entry["last_access"] = time.time()
+        self.index["entries"][key] = entry
+
+    def _remove(self, key):
+        entry = self.index["entries"].pop(key)
+        self._remove_files(key)
+        return entry
+
+    def _evict(self, keep=None):
+        """
+        drops least recently used entries until the cache fits in max_bytes; keep (e.g. the
+        entry just inserted) is never evicted
+        """
+        entries = self.index["entries"]
+        total = sum(e["bytes"] for e in entries.values())
+        for key in sorted(entries, key=lambda k: entries[k]["last_access"]):
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            total -= self._remove(key)["bytes"]
+            self.index["evictions"] += 1
+
+    def stats(self):
+        with self._lock:
+            self._load_index()
+        entries = self.index["entries"].values()
+        lookups = self.index["hits"] + self.index["misses"]
+        return {
+            "entries": len(entries),
+            "bytes": sum(e["bytes"] for e in entries),
+            "max_bytes": self.max_bytes,
+            "hits": self.index["hits"],
+            "misses": self.index["misses"],
+            "hit_rate": self.index["hits"] / lookups if lookups else 0.0,
+            "evictions": self.index["evictions"],
+        }
+
+
+class ResultCache(LRUCache):
+    """
+    Stores the files written by ClueGoClient.export_results under root/<key>/, where key is the
+    hash of the analysis inputs. When the cache grows past max_bytes the least recently used
+    entries are evicted.
+    """
+
+    def __init__(
+        self,
+        root=str(Path.home()) + "/ClueGOResultCache",
+        max_bytes=2 * 1024**3,
+    ):
+        super().__init__(root, max_bytes)
+
+    def _remove_files(self, key):
+        shutil.rmtree(os.path.join(self.root, key), ignore_errors=True)
+
+    def get(self, key, formats=None):
+        """
+        Returns {format: [paths]} if every requested format (all of EXPORT_FORMATS if None) is
+        cached for key, otherwise None.
+        """
+        if formats is None:
+            formats = list(EXPORT_FORMATS)
+        with self._lock:
+            self._load_index()
+            entry = self.index["entries"].get(key)
+            if entry is not None and not set(formats) <= set(entry.get("formats", ())):
+                entry = None
+            if entry is not None and not self.__complete(key, entry):
+                # files deleted behind the cache's back, drop the entry
+                self._remove(key)
+                entry = None
+
+            if entry is None:
+                self._miss()
+                self._save_index()
+                return None
+
+            self._hit(key)
+            self._save_index()
+
+            folder = os.path.join(self.root, key)
+            return {
+                fmt: [os.path.join(folder, name) for name in names]
+                for fmt, names in entry["files"].items()
+                if fmt in formats
+            }
+
+    def __complete(self, key, entry):
+        folder = os.path.join(self.root, key)
+        return all(
+            os.path.exists(os.path.join(folder, name))
+            for names in entry["files"].values()
+            for name in names
+        )
+
+    def put(self, key, manifest, inputs=None):
+        """
+        Copies the files of an export_results manifest into the cache, next to the formats
+        already cached for key, and returns {format: [paths]} of the manifest's formats.
+        Returns None without copying anything if a download failed (the entry would be
+        incomplete) or if the files alone are larger than max_bytes.
+        """
+        failed = sorted(
+            {
+                f["format"]
+                for f in manifest["files"]
+                if not str(f["status"]).startswith("2")
+            }
+        )
+        if failed:
+            print(f"result_cache\t{key[:12]} not cached, failed downloads: {failed}")
+            return None
+        size = sum(f["bytes"] for f in manifest["files"])
+        if size > self.max_bytes:
+            print(f"result_cache\t{key[:12]} is larger than max_bytes, not cached")
+            return None
+
+        folder = os.path.join(self.root, key)
+        os.makedirs(folder, exist_ok=True)
+
+        files = {}
+        for f in manifest["files"]:
+            name = os.path.basename(f["path"])
+            shutil.copyfile(f["path"], os.path.join(folder, name))
+            files.setdefault(f["format"], []).append(name)
+
+        with self._lock:
+            self._load_index()
+            entry = self.index["entries"].get(key)
+            if entry is not None and self.__complete(key, entry):
+                # e.g. the table was cached alone before, keep it next to the new formats
+                files = dict(entry["files"], **files)
+            size = sum(
+                os.path.getsize(os.path.join(folder, name))
+                for names in files.values()
+                for name in names
+            )
+            self._add(
+                key,
+                {
+                    "files": files,
+                    "formats": sorted(files),
+                    "bytes": size,
+                    "inputs": inputs,
+                },
+            )
+            self._evict(keep=key)
+            self._save_index()
+
+        return {
+            fmt: [os.path.join(folder, name) for name in names]
+            for fmt, names in files.items()
+            if fmt in {f["format"] for f in manifest["files"]}
+        }
+
+
+def cached_analysis(
+    client,
+    cache,
+    analysis_name,
+    formats=None,
+    analysis_option="Cancel and refine selection",
+):
+    """
+    Runs analysis_name with the client's current settings unless an identical analysis is cached.
+    Returns ({format: [paths]}, hit). analysis_option is passed to ClueGoClient.run_analysis.
+
+    The key only covers settings applied through client, so the cache is bypassed (neither read
+    nor written) while any of ClueGoClient.missing_analysis_inputs is unknown.
+    """
+    missing = client.missing_analysis_inputs()
+    inputs = client.analysis_inputs()
+    key = inputs_key(inputs)
+
+    if missing:
+        print(f"cached_analysis\tnot cached, never set: {missing}")
+    else:
+        files = cache.get(key, formats)
+        if files is not None:
+            print(f"cached_analysis\thit\t{key[:12]}")
+            return files, True
+
+    response = client.run_analysis(analysis_name, analysis_option)
+    if response is None or not str(response.status_code).startswith("2"):
+        raise RuntimeError(f"ClueGO analysis {analysis_name!r} failed")
+
+    manifest = client.export_results(client.get_current_network_suid(), formats=formats)
+    files = None if missing else cache.put(key, manifest, inputs)
+    if files is None:
+        files = {}
+        for f in manifest["files"]:
+            if str(f["status"]).startswith("2"):
+                files.setdefault(f["format"], []).append(f["path"])
+    return files, False
+
+
+if __name__ == "__main__":
+    # python result_cache.py stats [cache folder]
+    if len(sys.argv) < 2 or sys.argv[1] != "stats":
+        print("usage: python result_cache.py stats [cache folder]")
+        sys.exit(1)
+    cache = ResultCache(*sys.argv[2:3])
+    for name, value in cache.stats().items():
+        print(f"{name}\t{value}")
@@ -0,0 +1,245 @@
+# SQLite store of ClueGO result tables across runs, for cross-run questions
+#   python result_store.py ingest <db> <result table>...
+#   python result_store.py sweep <db> [sweep checkpoint]
+#   python result_store.py term <db> <term ID>
+#   python result_store.py gene <db> <gene>
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from cluego_table import ClueGoTable
+
+TABLE_FILE = "ClueGO-Result-Table.txt"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    name TEXT,
+    params TEXT,
+    ingested REAL
+);
+CREATE TABLE IF NOT EXISTS terms (
+    run_id INTEGER NOT NULL REFERENCES runs(run_id) ON DELETE CASCADE,
+    term_id TEXT NOT NULL,
+    term_name TEXT,
+    ontology TEXT,
+    p_value REAL,
+    p_corrected REAL,
+    group_p_value REAL,
+    group_p_corrected REAL,
+    pct_genes REAL,
+    nr_genes INTEGER,
+    go_level_min INTEGER,
+    go_level_max INTEGER,
+    groups TEXT,
+    PRIMARY KEY (term_id, run_id)
+);
+CREATE TABLE IF NOT EXISTS term_genes (
+    run_id INTEGER NOT NULL REFERENCES runs(run_id) ON DELETE CASCADE,
+    term_id TEXT NOT NULL,
+    gene TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS terms_run ON terms(run_id);
+CREATE INDEX IF NOT EXISTS term_genes_gene ON term_genes(gene, run_id);
+CREATE INDEX IF NOT EXISTS term_genes_term ON term_genes(term_id, run_id);
+CREATE INDEX IF NOT EXISTS term_genes_run ON term_genes(run_id);
+"""
+
+
+class ResultStore:
+    """
+    Every ingested ClueGO result table is a run, identified by its path and described by a
+    name and free-form params (stored as JSON, e.g. a sweep job {"n": 50, "specificity":
+    "global"}; filter on them with json_extract(runs.params, '$.specificity')).
+
+    A table whose path, mtime and size match an ingested run is skipped, so re-ingesting an
+    output folder only reads the new or changed tables.
+    """
+
+    def __init__(self, path="cluego_results.sqlite"):
+        self.path = path
+        self._lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("PRAGMA foreign_keys=ON")
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __ingested(self, path, stat):
+        row = self.db.execute(
+            "SELECT run_id, mtime_ns, size FROM runs WHERE path = ?", (path,)
+        ).fetchone()
+        if row is None:
+            return None, False
+        return row[0], (row[1], row[2]) == (stat.st_mtime_ns, stat.st_size)
+
+    def __insert(self, path, stat, table, name, params):
+        cursor = self.db.execute(
+            "INSERT INTO runs (path, mtime_ns, size, name, params, ingested)"
+            " VALUES (?, ?, ?, ?, ?, ?)",
+            (
+                path,
+                stat.st_mtime_ns,
+                stat.st_size,
+                name,
+                json.dumps(params, sort_keys=True),
+                time.time(),
+            ),
+        )
+        run_id = cursor.lastrowid
+
+        frame = table.to_frame()
+        rows = zip(
+            [run_id] * len(frame),
+            frame.index.astype(str),
+            frame["term_names"],
+            frame["ontology"].astype(object).where(frame["ontology"].notna(), None),
+            *(
+                frame[c].astype(object).where(frame[c].notna(), None)
+                for c in ("p_value", "p_corrected", "group_p_value", "group_p_corrected")
+            ),
+            frame["pct_genes"].astype(float),
+            frame["nr_genes"].astype(int),
+            frame["go_level_min"].astype(int),
+            frame["go_level_max"].astype(int),
+            [json.dumps(groups) for groups in table.groups],
+        )
+        self.db.executemany(
+            "INSERT OR REPLACE INTO terms VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            rows,
+        )
+
+        term_rows, gene_cols = table.annotation.matrix.nonzero()
+        self.db.executemany(
+            "INSERT INTO term_genes VALUES (?, ?, ?)",
+            zip(
+                [run_id] * len(term_rows),
+                np.asarray(table.terms, dtype=str)[term_rows],
+                np.asarray(table.annotation.genes, dtype=str)[gene_cols],
+            ),
+        )
+        return run_id
+
+    def ingest_many(self, tables):
+        """
+        Ingests (path, name, params) triples in one transaction. Returns the number of tables
+        read; unchanged ones are skipped, changed ones replace their previous run.
+        """
+        ingested = 0
+        with self._lock, self.db:
+            for path, name, params in tables:
+                path = os.path.abspath(path)
+                stat = os.stat(path)
+                run_id, unchanged = self.__ingested(path, stat)
+                if unchanged:
+                    continue
+                if run_id is not None:
+                    self.db.execute("DELETE FROM runs WHERE run_id = ?", (run_id,))
+                table = ClueGoTable.from_file(path)
+                self.__insert(path, stat, table, name, params)
+                ingested += 1
+        return ingested
+
+    def ingest(self, path, name=None, params=None):
+        return self.ingest_many([(path, name, params)])
+
+    def ingest_sweep(self, checkpoint_path="sweep_checkpoint.json"):
+        """
+        ingests the result table of every completed job of a sweep.SweepRunner checkpoint,
+        with the job as params
+        """
+        from sweep import job_name
+
+        with open(checkpoint_path) as f:
+            completed = json.load(f)["completed"]
+        tables = []
+        for result in completed.values():
+            for path in result["files"]:
+                if os.path.basename(path) == TABLE_FILE and os.path.exists(path):
+                    job = result["job"]
+                    tables.append((path, job_name(job), job))
+        return self.ingest_many(tables)
+
+    def query(self, sql, params=()):
+        with self._lock:
+            return pd.read_sql_query(sql, self.db, params=params)
+
+    def runs(self):
+        return self.query("SELECT * FROM runs ORDER BY run_id")
+
+    def runs_with_term(self, term_id, max_p=None):
+        """
+        every run that reported term_id, with its p-values, most significant first
+        """
+        sql = (
+            "SELECT runs.name, runs.params, terms.*"
+            " FROM terms JOIN runs USING (run_id) WHERE terms.term_id = ?"
+        )
+        args = [term_id]
+        if max_p is not None:
+            sql += " AND terms.p_corrected <= ?"
+            args.append(max_p)
+        return self.query(sql + " ORDER BY terms.p_corrected", args)
+
+    def terms_with_gene(self, gene, run_ids=None):
+        """
+        every (run, term) whose associated genes include gene
+        """
+        sql = (
+            "SELECT runs.run_id, runs.name, terms.term_id, terms.term_name, terms.p_corrected"
+            " FROM term_genes"
+            " JOIN terms USING (term_id, run_id)"
+            " JOIN runs USING (run_id)"
+            " WHERE term_genes.gene = ?"
+        )
+        args = [gene]
+        if run_ids is not None:
+            run_ids = list(run_ids)
+            sql += f" AND term_genes.run_id IN ({','.join('?' * len(run_ids))})"
+            args.extend(run_ids)
+        return self.query(sql + " ORDER BY runs.run_id, terms.p_corrected", args)
+
+    def term_genes(self, term_id, run_id):
+        rows = self.query(
+            "SELECT gene FROM term_genes WHERE term_id = ? AND run_id = ?",
+            (term_id, run_id),
+        )
+        return list(rows["gene"])
+
+
+if __name__ == "__main__":
+    commands = ("ingest", "sweep", "term", "gene")
+    if len(sys.argv) < 3 or sys.argv[1] not in commands:
+        print("usage: python result_store.py {ingest,sweep,term,gene} <db> ...")
+        sys.exit(1)
+    command, db = sys.argv[1], sys.argv[2]
+    with ResultStore(db) as store:
+        start = time.perf_counter()
+        if command == "ingest":
+            result = f"{store.ingest_many((p, None, None) for p in sys.argv[3:])} tables ingested"
+        elif command == "sweep":
+            result = f"{store.ingest_sweep(*sys.argv[3:4])} tables ingested"
+        elif command == "term":
+            result = store.runs_with_term(sys.argv[3]).to_string()
+        else:
+            result = store.terms_with_gene(sys.argv[3]).to_string()
+        print(result)
+        print(f"{1000 * (time.perf_counter() - start):.1f} ms")
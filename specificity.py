@@ -0,0 +1,104 @@
+# derive every network specificity from one ClueGO run over all GO levels
+import os
+
+import numpy as np
+
+from ClueGoClient import SPECIFICITY_PRESETS
+from cluego_table import ClueGoTable
+from enrichment import CORRECTIONS, correct
+
+# deepest GO level the all-levels run asks for
+MAX_GO_LEVEL = 20
+# an unrestricted all-levels run usually finds more than 1000 terms, which ClueGO would
+# otherwise cancel ("Cancel and refine selection")
+ANALYSIS_OPTION = "Continue analysis"
+
+
+def preset_mask(table, specificity):
+    """
+    Terms of a ClueGoTable that ClueGO would keep with the given specificity: a GO level in the
+    preset's window (terms without a GO level, e.g. KEGG, are not level filtered), at least
+    min genes from the list and at least min % of the term's genes mapped, like
+    enrichment.term_filter.
+    """
+    min_level, max_level, min_genes, pct_genes = SPECIFICITY_PRESETS[specificity]
+    no_level = table.go_level_min < 0
+    in_window = (table.go_level_min <= max_level) & (table.go_level_max >= min_level)
+    return (
+        (no_level | in_window)
+        & (table.nr_genes >= max(min_genes, 1))
+        & (table.pct_genes >= pct_genes)
+    )
+
+
+def derive(table, specificity, correction="holm", max_p=None):
+    """
+    The term table of one specificity, from an all-levels, unrestricted run. p_corrected is
+    recomputed over the kept terms only, as ClueGO would for a run with that preset.
+
+    :param correction (str) - one of enrichment.CORRECTIONS; "holm" is ClueGO's Bonferroni step down
+    :param max_p (float) - drop terms whose recomputed p_corrected is above it
+    """
+    if correction not in CORRECTIONS:
+        raise ValueError(f"correction must be one of {CORRECTIONS}")
+    mask = preset_mask(table, specificity)
+    frame = table.to_frame()[mask].copy()
+
+    p = frame["p_value"].to_numpy(np.float64)
+    frame["p_corrected"] = correct(p, correction)[0]
+    if max_p is not None:
+        frame = frame[frame["p_corrected"] <= max_p]
+    return frame.sort_values("p_value")
+
+
+def derive_all(table, specificities=None, correction="holm", max_p=None):
+    """
+    {specificity: term table} for every preset, see derive
+    """
+    if specificities is None:
+        specificities = list(SPECIFICITY_PRESETS)
+    return {s: derive(table, s, correction, max_p) for s in specificities}
+
+
+def run_all_levels(client, analysis_name, cache=None, max_level=MAX_GO_LEVEL, cluster_num=1):
+    """
+    Runs one ClueGO analysis with every GO level from 1 to max_level and no term restrictions,
+    and returns its result table as a ClueGoTable. With a result_cache.ResultCache the table
+    is reused for as long as the analysis inputs do not change; the cache is only used once
+    every one of them was applied through client (see ClueGoClient.missing_analysis_inputs).
+    """
+    client.set_min_max_GO_levels(1, max_level, all_levels=True)
+    client.set_analysis_properties_for_cluster(
+        no_restrictions=True, cluster_num=cluster_num
+    )
+
+    if cache is not None:
+        from result_cache import cached_analysis
+
+        files, _ = cached_analysis(
+            client, cache, analysis_name, ["table"], ANALYSIS_OPTION
+        )
+        return ClueGoTable.from_file(files["table"][0])
+
+    response = client.run_analysis(analysis_name, ANALYSIS_OPTION)
+    if response is None or not str(response.status_code).startswith("2"):
+        raise RuntimeError(f"ClueGO analysis {analysis_name!r} failed")
+    manifest = client.export_results(
+        client.get_current_network_suid(),
+        formats=["table"],
+        output_folder=os.path.join(client.OUTPUT_FOLDER, analysis_name),
+    )
+    path = next(f["path"] for f in manifest["files"] if f["format"] == "table")
+    return ClueGoTable.from_file(path)
+
+
+def run_presets(client, analysis_name, specificities=None, cache=None, **kwargs):
+    """
+    Every specificity's term table from a single ClueGO run, instead of one run per preset.
+    ClueGO is only needed again to draw a chosen preset's network:
+
+        client.set_network_specificity("medium")
+        client.run_analysis("medium")
+    """
+    table = run_all_levels(client, analysis_name, cache)
+    return derive_all(table, specificities, **kwargs)
@@ -0,0 +1,153 @@
+# checkpointed parameter sweeps over ClueGO analyses
+import itertools
+import json
+import os
+import threading
+import time
+from collections import deque
+
+from ClueGoClient import color_with_FC
+from get_significant_genes import get_diffy_expressed_genes
+
+
+def expand_grid(grid):
+    """
+    {"specificity": ["global", "medium"], "n": [50, 100]} -> list of 4 job dicts
+    """
+    return [dict(zip(grid, values)) for values in itertools.product(*grid.values())]
+
+
+def job_key(job):
+    return json.dumps(job, sort_keys=True)
+
+
+def job_name(job):
+    return f"{job['n']} | {job['specificity']}"
+
+
+class SweepRunner:
+    """
+    Runs one ClueGO analysis per point of a parameter grid. Each job dict needs a "specificity"
+    (see ClueGoClient.set_network_specificity) and an "n" (size of the gene list).
+
+    After every job the results are exported, the job is written to the checkpoint and, once more
+    than max_resident networks are open, the oldest one is removed from Cytoscape.
+    Re-running with the same checkpoint_path skips every job that already completed.
+    """
+
+    def __init__(
+        self,
+        client,
+        grid,
+        diff_file="diff/5s_vs_4s.gene_exp.diff",
+        checkpoint_path="sweep_checkpoint.json",
+        max_resident=3,
+        formats=None,
+        color=True,
+    ):
+        self.client = client
+        self.jobs = expand_grid(grid) if isinstance(grid, dict) else list(grid)
+        self.diff_file = diff_file
+        self.checkpoint_path = checkpoint_path
+        self.max_resident = max_resident
+        self.formats = formats
+        self.color = color
+
+        self._gene_ids = None
+        self._resident = {}
+        # jobs may be recorded from several ClueGoPool workers at once
+        self._lock = threading.Lock()
+        self.completed = self.load_checkpoint()
+
+    def load_checkpoint(self):
+        if self.checkpoint_path is None or not os.path.exists(self.checkpoint_path):
+            return {}
+        with open(self.checkpoint_path) as f:
+            return json.load(f)["completed"]
+
+    def save_checkpoint(self):
+        if self.checkpoint_path is None:
+            return
+        # write then rename so a crash mid-write never leaves a truncated checkpoint
+        tmp = self.checkpoint_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({"completed": self.completed}, f, indent=1)
+        os.replace(tmp, self.checkpoint_path)
+
+    def pending_jobs(self):
+        return [job for job in self.jobs if job_key(job) not in self.completed]
+
+    def gene_list(self, n):
+        with self._lock:
+            if self._gene_ids is None:
+                self._gene_ids = list(
+                    get_diffy_expressed_genes(self.diff_file)["gene_id"]
+                )
+        return self._gene_ids[:n]
+
+    def release(self, client, network_suid):
+        """
+        keeps at most max_resident result networks open in client's Cytoscape
+        """
+        resident = self._resident.setdefault(id(client), deque())
+        resident.append(network_suid)
+        while len(resident) > self.max_resident:
+            suid = resident.popleft()
+            client.remove_analysis_result(suid)
+            if self.color:
+                from table_sync import TABLES
+
+                TABLES.forget(suid, client.CYTOSCAPE_BASE_URL)
+
+    def run_job(self, client, job):
+        start = time.perf_counter()
+        name = job_name(job)
+
+        client.set_gene_ids(self.gene_list(job["n"]))
+        client.set_network_specificity(job["specificity"])
+        # raises, so a ClueGoPool can tell a lost endpoint from a failed analysis
+        client.run_analysis(name, raise_errors=True)
+
+        network_suid = client.get_current_network_suid()
+        if self.color:
+            color_with_FC(
+                network_suid, self.diff_file, base_url=client.CYTOSCAPE_BASE_URL
+            )
+
+        folder = os.path.join(
+            client.OUTPUT_FOLDER, name.replace(" | ", "_").replace(os.sep, "_")
+        )
+        manifest = client.export_results(
+            network_suid, formats=self.formats, output_folder=folder
+        )
+        self.release(client, network_suid)
+
+        return {
+            "job": job,
+            "network_suid": network_suid,
+            "files": [f["path"] for f in manifest["files"]],
+            "seconds": time.perf_counter() - start,
+        }
+
+    def record(self, job, result):
+        with self._lock:
+            self.completed[job_key(job)] = result
+            self.save_checkpoint()
+
+    def report(self, done, start):
+        hours = (time.perf_counter() - start) / 3600
+        rate = done / hours if hours > 0 else 0.0
+        print(
+            f"sweep\t{len(self.completed)}/{len(self.jobs)}\t{rate:.1f} jobs/hour"
+        )
+
+    def run(self):
+        pending = self.pending_jobs()
+        print(f"sweep\t{len(self.jobs) - len(pending)} jobs already in checkpoint")
+
+        start = time.perf_counter()
+        for done, job in enumerate(pending, 1):
+            self.record(job, self.run_job(self.client, job))
+            self.report(done, start)
+
+        return self.completed
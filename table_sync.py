@@ -0,0 +1,152 @@
+# uploads only the cells of a Cytoscape table that changed since the last upload
+import threading
+from collections import OrderedDict
+
+
+class TableSync:
+    """
+    Keeps a local snapshot of the Cytoscape tables it has read or written, keyed by
+    (base_url, network SUID, table), and sends only the columns (and by default only the rows)
+    that differ from the snapshot. Uploads are split into batches of about batch_bytes of JSON.
+
+    The snapshot is only as fresh as the last read or write made through this object; call
+    forget() when a network is changed or removed some other way.
+
+    :param key_column (str) - column identifying rows, both locally and in Cytoscape
+    :param batch_bytes (int) - target size of one upload
+    :param max_networks (int) - snapshots kept, least recently used are dropped first
+    """
+
+    def __init__(self, key_column="name", batch_bytes=1 << 20, max_networks=16):
+        self.key_column = key_column
+        self.batch_bytes = batch_bytes
+        self.max_networks = max_networks
+        self._snapshots = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __key(self, network, table, base_url):
+        import py4cytoscape as cy
+
+        if base_url is None:
+            base_url = cy.DEFAULT_BASE_URL
+        suid = cy.get_network_suid(network, base_url=base_url)
+        return (base_url, suid, table), suid, base_url
+
+    def __entry(self, key):
+        with self._lock:
+            entry = self._snapshots.get(key)
+            if entry is None:
+                entry = self._snapshots[key] = {"columns": None, "data": None}
+            self._snapshots.move_to_end(key)
+            while len(self._snapshots) > self.max_networks:
+                self._snapshots.popitem(last=False)
+        return entry
+
+    def snapshot(self, columns, network=None, table="node", base_url=None):
+        """
+        The key column plus those of columns that exist in Cytoscape. Only columns not yet in
+        the snapshot are fetched.
+        """
+        import py4cytoscape as cy
+
+        key, suid, base_url = self.__key(network, table, base_url)
+        entry = self.__entry(key)
+        if entry["columns"] is None:
+            entry["columns"] = set(
+                cy.get_table_column_names(table, network=suid, base_url=base_url)
+            )
+
+        wanted = [c for c in columns if c in entry["columns"] and c != self.key_column]
+        data = entry["data"]
+        missing = [c for c in wanted if data is None or c not in data]
+        if missing or data is None:
+            fetched = cy.get_table_columns(
+                table, [self.key_column] + missing, network=suid, base_url=base_url
+            ).set_index(self.key_column)
+            fetched = fetched[~fetched.index.duplicated()]
+            data = fetched if data is None else data.join(fetched, how="outer")
+            entry["data"] = data
+        return data[wanted].reset_index()
+
+    def changes(self, data, network=None, table="node", base_url=None, rows=True):
+        """
+        The part of data (a DataFrame with the key column) that differs from Cytoscape's table:
+        changed columns only, and with rows=True changed rows only.
+        """
+        columns = [c for c in data.columns if c != self.key_column]
+        current = self.snapshot(columns, network, table, base_url).set_index(
+            self.key_column
+        )
+        new = data.drop_duplicates(self.key_column).set_index(self.key_column)
+        old = current.reindex(index=new.index, columns=columns)
+
+        # NaN on both sides counts as unchanged
+        changed = (old != new[columns]) & ~(old.isna() & new[columns].isna())
+        changed_columns = [c for c in columns if changed[c].any()]
+        if rows:
+            new = new[changed[changed_columns].any(axis=1)]
+        return new[changed_columns].reset_index()
+
+    def push(self, data, network=None, table="node", base_url=None, rows=True):
+        """
+        Uploads the changes in data to Cytoscape with py4cytoscape.load_table_data and updates
+        the snapshot. Returns {"rows", "columns", "cells", "batches", "bytes"} of what was sent.
+        """
+        import py4cytoscape as cy
+
+        delta = self.changes(data, network, table, base_url, rows)
+        key, suid, base_url = self.__key(network, table, base_url)
+        stats = {"rows": len(delta), "columns": list(delta.columns[1:]), "batches": 0}
+        stats["cells"] = stats["rows"] * len(stats["columns"])
+        stats["bytes"] = 0
+        if stats["cells"] == 0:
+            return stats
+
+        for batch in self.__batches(delta):
+            cy.load_table_data(
+                batch,
+                data_key_column=self.key_column,
+                table=table,
+                table_key_column=self.key_column,
+                network=suid,
+                base_url=base_url,
+            )
+            stats["batches"] += 1
+            stats["bytes"] += len(batch.to_json(orient="records"))
+
+        entry = self.__entry(key)
+        with self._lock:
+            if entry["data"] is None:
+                # the snapshot was dropped meanwhile; the next call fetches it again
+                return stats
+            entry["columns"].update(stats["columns"])
+            uploaded = delta.set_index(self.key_column)
+            data = entry["data"]
+            data = data.reindex(index=data.index.union(uploaded.index))
+            for column in uploaded.columns:
+                data.loc[uploaded.index, column] = uploaded[column]
+            entry["data"] = data
+        return stats
+
+    def __batches(self, delta):
+        # size batches from the JSON size of a sample of rows
+        sample = delta.head(100)
+        row_bytes = max(1, len(sample.to_json(orient="records")) // max(1, len(sample)))
+        rows = max(1, self.batch_bytes // row_bytes)
+        for start in range(0, len(delta), rows):
+            yield delta.iloc[start : start + rows]
+
+    def forget(self, network=None, base_url=None):
+        """
+        drops the snapshots of one network, or of every network if network is None
+        """
+        with self._lock:
+            for key in list(self._snapshots):
+                if network is None or (
+                    key[1] == network and base_url in (None, key[0])
+                ):
+                    del self._snapshots[key]
+
+
+# shared by color_with_FC and the sweep, so snapshots survive between calls
+TABLES = TableSync()
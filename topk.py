@@ -0,0 +1,160 @@
+# top-n genes by absolute fold change without sorting, in memory or streamed over a cuffdiff file
+
+import numpy as np
+import pandas as pd
+
+from get_significant_genes import CUFFDIFF_DTYPES
+
+# ranking keys: the columns they are computed from
+KEYS = {
+    # log2(fold_change) as cuffdiff reports it
+    "log2fc": ["log2(fold_change)"],
+    # log2(value_1 / value_2), z-normalized over the significant genes, see heatmaps.py
+    "z": ["value_1", "value_2"],
+}
+
+Z_COLUMN = "z_norm_log2FC"
+
+
+def raw_scores(D, key):
+    """
+    the value genes are ranked by (before z-normalization), NaN where it is not finite
+    """
+    if key == "log2fc":
+        values = D["log2(fold_change)"].to_numpy(np.float64)
+    elif key == "z":
+        with np.errstate(divide="ignore", invalid="ignore"):
+            values = np.log2(
+                D["value_1"].to_numpy(np.float64) / D["value_2"].to_numpy(np.float64)
+            )
+    else:
+        raise ValueError(f"unknown ranking key {key!r}, expected one of {list(KEYS)}")
+    return np.where(np.isfinite(values), values, np.nan)
+
+
+def top_k_indices(scores, k):
+    """
+    Positions of the k largest |scores|, largest first; NaN scores are never selected.
+    O(len(scores)) with np.argpartition instead of a full sort.
+    """
+    magnitude = np.abs(scores)
+    valid = np.flatnonzero(~np.isnan(magnitude))
+    k = min(k, len(valid))
+    if k == 0:
+        return valid[:0]
+    if k < len(valid):
+        valid = valid[np.argpartition(-magnitude[valid], k - 1)[:k]]
+    # stable, so ties keep file order
+    return valid[np.argsort(-magnitude[valid], kind="stable")]
+
+
+def top_k(D, n, key="log2fc"):
+    """
+    The n rows of D with the largest absolute ranking key, largest first. With key="z" the
+    z-score is computed over all of D and added as Z_COLUMN.
+    """
+    scores = raw_scores(D, key)
+    if key == "z":
+        scores = (scores - np.nanmean(scores)) / np.nanstd(scores, ddof=1)
+    index = top_k_indices(scores, n)
+    top = D.iloc[index].copy()
+    if key == "z":
+        top[Z_COLUMN] = scores[index]
+    return top
+
+
+class RunningStats:
+    """
+    count, mean and variance of a stream of values, merged chunk by chunk (Chan et al.)
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def update(self, values):
+        values = values[~np.isnan(values)]
+        if len(values) == 0:
+            return
+        count = len(values)
+        mean = values.mean()
+        m2 = ((values - mean) ** 2).sum()
+
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean += delta * count / total
+        self.m2 += m2 + delta**2 * self.count * count / total
+        self.count = total
+
+    @property
+    def std(self):
+        # sample standard deviation, like pandas' Series.std
+        return np.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else np.nan
+
+
+def _chunks(filepath, columns, chunksize):
+    dtype = {c: t for c, t in CUFFDIFF_DTYPES.items() if columns is None or c in columns}
+    return pd.read_csv(
+        filepath, delimiter="\t", usecols=columns, dtype=dtype, chunksize=chunksize
+    )
+
+
+def stream_top_k(
+    filepath,
+    n,
+    key="log2fc",
+    columns=None,
+    significant_only=True,
+    chunksize=100_000,
+):
+    """
+    top_k over a cuffdiff file read chunksize rows at a time. Memory is O(n + chunksize):
+    each chunk's top n is merged into a running frame of at most n rows. With key="z" a first pass
+    computes the mean and standard deviation of the key.
+
+    :param columns (list) - columns to return, all if None
+    :param significant_only (bool) - rank only rows with significant == "yes"
+    """
+    usecols = None
+    if columns is not None:
+        usecols = list(dict.fromkeys(list(columns) + KEYS[key] + ["significant"]))
+
+    def scored_chunks():
+        for chunk in _chunks(filepath, usecols, chunksize):
+            if significant_only:
+                chunk = chunk[chunk["significant"] == "yes"]
+            yield chunk, raw_scores(chunk, key)
+
+    mean, std = 0.0, 1.0
+    if key == "z":
+        stats = RunningStats()
+        for _, scores in scored_chunks():
+            stats.update(scores)
+        mean, std = stats.mean, stats.std
+
+    # running top n: the selected rows are copied out of each chunk, so no chunk outlives its
+    # iteration
+    top, top_scores, top_rows = None, np.empty(0), np.empty(0, dtype=np.int64)
+    seen = 0
+    for chunk, scores in scored_chunks():
+        scores = (scores - mean) / std
+        idx = top_k_indices(scores, n)
+        if len(idx):
+            picked = chunk.iloc[idx]
+            top = picked if top is None else pd.concat([top, picked])
+            top_scores = np.concatenate([top_scores, scores[idx]])
+            top_rows = np.concatenate([top_rows, seen + idx])
+            # |score| descending, ties in file order like top_k
+            order = np.lexsort((top_rows, -np.abs(top_scores)))[:n]
+            top = top.iloc[order].copy()
+            top_scores, top_rows = top_scores[order], top_rows[order]
+        seen += len(chunk)
+
+    if top is None:
+        top = next(iter(_chunks(filepath, usecols, 1))).iloc[0:0]
+    if key == "z":
+        top[Z_COLUMN] = top_scores
+    if columns is not None:
+        top = top[list(columns) + ([Z_COLUMN] if key == "z" else [])]
+    return top.reset_index(drop=True)
@@ -0,0 +1,118 @@
+# shared HTTP transport for talking to cyREST / ClueGO
+import json
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+class Transport:
+    """
+    Owns a single requests.Session so every call made by a ClueGoClient reuses the same
+    keep-alive connection(s) to Cytoscape instead of opening a new TCP connection per call.
+
+    :param connect_timeout (float) - seconds to wait for a connection to Cytoscape
+    :param read_timeout (float) - seconds to wait for a response; None waits forever
+    :param retries (int) - number of retries on connection errors and 502/503/504 responses
+    :param backoff_factor (float) - sleep between retries is backoff_factor * 2 ** (retry - 1)
+    :param pool_maxsize (int) - number of sockets kept alive per host
+    :param instrumentation (Instrumentation) - records a span per call if set, see instrumentation.py
+    """
+
+    def __init__(
+        self,
+        connect_timeout=5,
+        read_timeout=60,
+        retries=3,
+        backoff_factor=0.5,
+        pool_maxsize=8,
+        instrumentation=None,
+    ):
+        self.timeout = (connect_timeout, read_timeout)
+        self.instrumentation = instrumentation
+
+        # reads are never retried: a timed out run_analysis is still running in ClueGO
+        retry = Retry(
+            total=retries,
+            connect=retries,
+            read=0,
+            status=retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=(502, 503, 504),
+            allowed_methods=frozenset(["GET", "PUT", "DELETE", "HEAD", "OPTIONS"]),
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(
+            pool_connections=1, pool_maxsize=pool_maxsize, max_retries=retry
+        )
+
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def request(self, method, url, timeout=None, endpoint=None, **kwargs):
+        """
+        timeout can be a single number, a (connect, read) tuple or None to use the default.
+        endpoint is the URL template the call is reported under, the URL itself if None.
+        """
+        if timeout is None:
+            timeout = self.timeout
+        if self.instrumentation is None:
+            return self.session.request(method, url, timeout=timeout, **kwargs)
+
+        endpoint = endpoint or url
+        sent = _body_size(kwargs)
+        start = time.perf_counter()
+        try:
+            response = self.session.request(method, url, timeout=timeout, **kwargs)
+        except Exception as e:
+            self.instrumentation.span(method, endpoint, start, sent, error=e)
+            raise
+        if kwargs.get("stream"):
+            # the span ends when the body has been read and the response is closed
+            _record_on_close(
+                self.instrumentation, response, method, endpoint, start, sent
+            )
+        else:
+            self.instrumentation.span(method, endpoint, start, sent, response)
+        return response
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def put(self, url, **kwargs):
+        return self.request("PUT", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def delete(self, url, **kwargs):
+        return self.request("DELETE", url, **kwargs)
+
+    def close(self):
+        self.session.close()
+
+
+def _record_on_close(instrumentation, response, *span_args):
+    close = response.close
+    recorded = []
+
+    def close_and_record():
+        close()
+        if not recorded:
+            recorded.append(True)
+            instrumentation.span(*span_args, response, stream=True)
+
+    response.close = close_and_record
+
+
+def _body_size(kwargs):
+    if kwargs.get("json") is not None:
+        return len(json.dumps(kwargs["json"]))
+    data = kwargs.get("data")
+    if isinstance(data, str):
+        return len(data.encode())
+    if isinstance(data, bytes):
+        return len(data)
+    return 0